@@ -0,0 +1,255 @@
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from concurrent.futures import Future
+from typing import AsyncIterator, Callable, Iterator, Optional
+import asyncio
+import json
+from config import Config
+from models.llm_backends import BACKENDS
+from utils.image_processor import ImageProcessor
+from utils.preview_cache import MEDIA_TYPES
+from utils.scheduler import PipelineScheduler, QueueFull, DeadlineExceeded
+
+class Question(BaseModel):
+    question: str
+    backend: Optional[str] = None  # LLM backend for this turn; the deployment default if omitted
+
+def check_backend(backend: Optional[str]):
+    if backend is not None and backend not in set(BACKENDS) | {"local", "router"}:
+        raise HTTPException(status_code=400, detail=f"Unknown LLM backend '{backend}'.")
+
+async def iterate_in_thread(iterator_factory: Callable[[], Iterator[str]],
+                            submit: Callable[[Callable], Future]) -> AsyncIterator[str]:
+    """
+    Drive a blocking iterator on one scheduler worker, returning an async
+    iterator over its items
+
+    The whole iterator runs on a single thread so LangGraph's context-local
+    state stays consistent between chunks. submit is awaited before this
+    returns, so admission errors surface before the response starts.
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    done = object()
+
+    def run():
+        try:
+            for item in iterator_factory():
+                loop.call_soon_threadsafe(items.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(items.put_nowait, done)
+
+    # Submission can block (a worker pool may first move the session), so off the loop
+    future = await asyncio.to_thread(submit, run)
+    # A request shed in the queue never runs, so surface its error here
+    future.add_done_callback(
+        lambda f: f.exception() and loop.call_soon_threadsafe(items.put_nowait, f.exception())
+    )
+
+    async def drain():
+        while True:
+            item = await items.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    return drain()
+
+def profile_requested(request: Request) -> Optional[bool]:
+    """X-Profile: 1 forces a profile of the request; absent, sampling decides"""
+    value = request.headers.get("x-profile")
+    if value is None:
+        return None
+    return value.strip().lower() in ("1", "true", "yes")
+
+async def run_scheduled(future: Future):
+    """Await a scheduler future, mapping shedding to an HTTP error"""
+    try:
+        return await asyncio.wrap_future(future)
+    except DeadlineExceeded:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is overloaded, please retry shortly.",
+            headers={"Retry-After": "5"}
+        )
+
+def create_api(chatbot, scheduler: Optional[PipelineScheduler] = None) -> FastAPI:
+    """
+    Build the JSON API over an already initialized ConversationalImageChatbot
+
+    Sessions are addressed by id in the URL; each has its own image and
+    conversation. Model calls go through the scheduler's worker threads so
+    the event loop stays free; pass the UI's scheduler to share its limits.
+    The X-User-Id header identifies the caller for fair scheduling, and
+    X-Profile: 1 writes a profile of the request to Config.PROFILE_DIR.
+    """
+    app = FastAPI(title="Conversational Image Chatbot API")
+    scheduler = scheduler or PipelineScheduler(chatbot)
+
+    @app.exception_handler(QueueFull)
+    async def queue_full(request: Request, exc: QueueFull):
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Server is busy, please retry shortly."},
+            headers={"Retry-After": "1"}
+        )
+
+    @app.exception_handler(DeadlineExceeded)
+    async def deadline_exceeded(request: Request, exc: DeadlineExceeded):
+        # Raised at admission, when the expected queue wait already misses the deadline
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is overloaded, please retry shortly."},
+            headers={"Retry-After": "5"}
+        )
+
+    @app.get("/v1/health")
+    async def health():
+        return {"status": "ok", "queues": await asyncio.to_thread(scheduler.stats)}
+
+    @app.get("/v1/stats")
+    async def stats():
+        """Per-class queue depth, shedding and queue wait time"""
+        return await asyncio.to_thread(scheduler.stats)
+
+    @app.post("/v1/sessions/{session_id}/image")
+    async def analyze_image(session_id: str, request: Request):
+        """Analyze raw image bytes sent as the request body"""
+        data = await request.body()
+        if not data:
+            raise HTTPException(status_code=400, detail="Request body must contain image bytes.")
+        if len(data) > Config.API_MAX_IMAGE_BYTES:
+            raise HTTPException(status_code=413, detail="Image is too large.")
+        user_id, profile = request.headers.get("x-user-id"), profile_requested(request)
+
+        def validate_and_submit():
+            # verify() reads the whole body; on the event loop it would stall other requests
+            if not ImageProcessor.validate_image(data):
+                return None
+            return scheduler.submit_analysis(data, session_id, user_id=user_id, profile=profile)
+
+        future = await asyncio.to_thread(validate_and_submit)
+        if future is None:
+            raise HTTPException(status_code=400, detail="Invalid image file.")
+        response = await run_scheduled(future)
+
+        session = await asyncio.to_thread(chatbot.session_info, session_id)
+        return {
+            "session_id": session_id,
+            "response": response,
+            # The LLM's description is still coming (fast-first-response
+            # mode); it is added to the session history when done
+            "response_pending": session['response_pending'],
+            "caption": session['caption'],
+            "total_objects": session['total_objects'],
+            "detections": session['detections'],
+        }
+
+    @app.post("/v1/sessions/{session_id}/questions")
+    async def ask_question(session_id: str, body: Question, request: Request):
+        """Ask a question about the session's image"""
+        check_backend(body.backend)
+        answer = await run_scheduled(await asyncio.to_thread(
+            scheduler.submit_chat, body.question, session_id,
+            user_id=request.headers.get("x-user-id"),
+            profile=profile_requested(request), backend=body.backend
+        ))
+        return {"session_id": session_id, "answer": answer}
+
+    @app.post("/v1/sessions/{session_id}/questions/stream")
+    async def stream_answer(session_id: str, body: Question, request: Request):
+        """Ask a question and receive the answer as server-sent events"""
+        # Submitted before the response starts so admission errors return 429/503
+        check_backend(body.backend)
+        profile = profile_requested(request)
+        chunks = await iterate_in_thread(
+            lambda: chatbot.chat_stream(
+                body.question, session_id, profile=profile, backend=body.backend
+            ),
+            lambda run: scheduler.submit_chat(
+                body.question, session_id,
+                user_id=request.headers.get("x-user-id"), fn=run
+            )
+        )
+
+        # Wait for the first chunk before responding, so a request shed while
+        # queued still gets a 503 instead of a stream that breaks off
+        try:
+            first = await anext(chunks)
+        except StopAsyncIteration:
+            first = None
+        except DeadlineExceeded:
+            raise HTTPException(
+                status_code=503,
+                detail="Server is overloaded, please retry shortly.",
+                headers={"Retry-After": "5"}
+            )
+
+        async def events():
+            try:
+                if first is not None:
+                    yield f"data: {json.dumps({'text': first})}\n\n"
+                    async for chunk in chunks:
+                        yield f"data: {json.dumps({'text': chunk})}\n\n"
+                yield "event: done\ndata: {}\n\n"
+            except DeadlineExceeded:
+                yield "event: error\ndata: {\"detail\": \"Server is overloaded\"}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/v1/sessions/{session_id}/annotated")
+    async def get_annotated(session_id: str, full: bool = False):
+        """
+        Annotated image of the session, WebP/JPEG encoded once and cached
+        
+        A display-sized preview by default; full=true returns the full
+        processed resolution.
+        """
+        path = await asyncio.to_thread(
+            chatbot.get_detection_preview, session_id, full_resolution=full
+        )
+        if path is None:
+            raise HTTPException(status_code=404, detail="No analyzed image in this session.")
+        # The URL shows whichever image the session has now, so no caching headers
+        return FileResponse(path, media_type=MEDIA_TYPES[Config.ANNOTATION_PREVIEW_FORMAT.upper()])
+
+    @app.get("/v1/sessions/{session_id}/history")
+    async def get_history(session_id: str, since: int = 0):
+        """
+        Conversation history of the session
+        
+        Pass the returned cursor as since to fetch only newer messages;
+        thread_id changes when a new image starts a new conversation.
+        """
+        session = await asyncio.to_thread(chatbot.session_info, session_id)
+        messages, cursor = await asyncio.to_thread(chatbot.get_history_since, session_id, since)
+        return {
+            "session_id": session_id,
+            "thread_id": session['thread_id'],
+            "messages": messages,
+            "cursor": cursor,
+        }
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+    from main import ConversationalImageChatbot
+
+    if Config.WORKER_PROCESSES > 0:
+        from utils.worker_pool import WorkerPool
+        pool = WorkerPool()
+        api = create_api(pool.chatbot, pool)
+    else:
+        api = create_api(ConversationalImageChatbot())
+
+    uvicorn.run(
+        api,
+        host=Config.API_HOST,
+        port=Config.API_PORT
+    )
@@ -1,71 +1,123 @@
 import gradio as gr
 from main import ConversationalImageChatbot
-import cv2
-import numpy as np
+from config import Config
+from utils.scheduler import PipelineScheduler, QueueFull, DeadlineExceeded
 
-# Initialize chatbot
-chatbot = ConversationalImageChatbot()
+def create_backend():
+    """
+    The chatbot and scheduler serving the UI
+    
+    With Config.WORKER_PROCESSES set, the models run in a pool of worker
+    processes and this process only routes requests to them.
+    """
+    if Config.WORKER_PROCESSES > 0:
+        from utils.worker_pool import WorkerPool
+        pool = WorkerPool()
+        return pool.chatbot, pool
+    
+    chatbot = ConversationalImageChatbot()
+    # Separate vision and chat queues in front of the chatbot
+    return chatbot, PipelineScheduler(chatbot)
+
+def apply_command_line():
+    import argparse
+    parser = argparse.ArgumentParser(description="Conversational image chatbot (web UI)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Profile every request into {Config.PROFILE_DIR}/")
+    parser.add_argument("--workers", type=int, default=Config.WORKER_PROCESSES,
+                        help="Model worker processes (0 runs the models in this process)")
+    args = parser.parse_args()
+    if args.profile:
+        Config.PROFILE_SAMPLE_RATE = 1.0
+    Config.WORKER_PROCESSES = args.workers
+
+# Options are applied before the models load so worker processes inherit them
+if __name__ == "__main__":
+    apply_command_line()
+
+# Initialize chatbot; worker processes import this module as __mp_main__ and skip it
+if __name__ != "__mp_main__":
+    chatbot, scheduler = create_backend()
+
+EMPTY_HISTORY = "No conversation history yet. Start chatting about the image!"
 
-def process_image(image):
-    """Handle new image upload"""
+def new_history_view():
+    """Per-browser state of the history panel: its thread, cursor and rendered text"""
+    return {"thread_id": None, "cursor": 0, "text": ""}
+
+def process_image(image, view, request: gr.Request):
+    """
+    Handle new image upload
+    
+    In fast-first-response mode the description built from local inference
+    is shown first and replaced by the LLM's once it arrives.
+    """
     if image is None:
-        return None, "Please upload an image first.", [], ""
+        yield None, "Please upload an image first.", [], gr.update(), view
+        return
+    
+    # Each browser session gets its own image and conversation
+    session_id = request.session_hash
     
     try:
-        # Save temporary image
-        temp_path = "temp_image.jpg"
-        
-        # Handle different image input types
-        if isinstance(image, np.ndarray):
-            cv2.imwrite(temp_path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
-        else:
-            image.save(temp_path)
+        # The uploaded file as is, so decoding happens once, at reduced resolution
+        with open(image, "rb") as f:
+            image_bytes = f.read()
         
         print("Processing image...")
         
         # Process image
-        response = chatbot.process_new_image(temp_path)
+        response = scheduler.submit_analysis(image_bytes, session_id).result()
         
         print("Getting detection visualization...")
-        # Get annotated image
-        annotated = chatbot.get_detection_visualization()
-        
-        # Convert annotated image from BGR to RGB for Gradio display
-        if annotated is not None:
-            annotated = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
+        # Encoded, display-sized preview; Gradio serves the file as is
+        annotated = chatbot.get_detection_preview(session_id)
         
         # Get initial history
-        history_text = show_conversation_history()
+        history_text, view = update_history(session_id, view)
         
         print("Image processing complete!")
         
         # Return with empty chat history for new image
-        return annotated, response, [], history_text
+        yield annotated, response, [], history_text, view
+        
+        polished = chatbot.get_opening_response(session_id)
+        if polished:
+            history_text, view = update_history(session_id, view)
+            yield gr.update(), polished, gr.update(), history_text, view
+    
+    except (QueueFull, DeadlineExceeded):
+        yield None, "The server is busy right now, please try again in a moment.", [], gr.update(), view
         
     except Exception as e:
         error_msg = f"Error processing image: {str(e)}"
         print(error_msg)
         import traceback
         traceback.print_exc()
-        return None, error_msg, [], ""
+        yield None, error_msg, [], gr.update(), view
 
-def chat_with_image(message, history):
+def chat_with_image(message, history, view, request: gr.Request):
     """Handle chat messages"""
+    session_id = request.session_hash
     if not message or message.strip() == "":
-        return history, "", show_conversation_history()
+        return history, "", gr.update(), view
     
     try:
         print(f"\nUser: {message}")
-        response = chatbot.chat(message)
+        response = scheduler.submit_chat(message, session_id).result()
         print(f"Bot: {response}\n")
         
         # Append to chat history
         history.append([message, response])
         
         # Update history display
-        history_text = show_conversation_history()
+        history_text, view = update_history(session_id, view)
         
-        return history, "", history_text
+        return history, "", history_text, view
+    
+    except (QueueFull, DeadlineExceeded):
+        history.append([message, "The server is busy right now, please try again in a moment."])
+        return history, message, gr.update(), view
         
     except Exception as e:
         error_msg = f"Error: {str(e)}"
@@ -73,31 +125,58 @@ def chat_with_image(message, history):
         import traceback
         traceback.print_exc()
         history.append([message, error_msg])
-        return history, "", show_conversation_history()
+        return history, "", gr.update(), view
+
+def format_messages(messages, start=1):
+    """Format history messages, numbering from start"""
+    formatted = []
+    for i, msg in enumerate(messages, start):
+        role = "👤 You" if msg["role"] == "user" else "🤖 Bot"
+        formatted.append(f"**Message {i}** - {role}:\n{msg['content']}\n")
+    return "\n---\n\n".join(formatted)
 
-def show_conversation_history():
-    """Display conversation history"""
+def update_history(session_id, view):
+    """
+    Bring the history panel up to date
+    
+    Only messages added since the view's cursor are formatted and appended;
+    a new image starts a new thread and a fresh view. Returns a no-op
+    update when nothing changed, so the panel isn't re-sent.
+    """
     try:
-        history = chatbot.llm.get_conversation_history()
-        if not history:
-            return "No conversation history yet. Start chatting about the image!"
+        thread_id = chatbot.session_info(session_id)['thread_id']
+        if view is None or view["thread_id"] != thread_id:
+            view = dict(new_history_view(), thread_id=thread_id)
         
-        formatted = []
-        for i, msg in enumerate(history, 1):
-            role = "👤 You" if msg["role"] == "user" else "🤖 Bot"
-            formatted.append(f"**Message {i}** - {role}:\n{msg['content']}\n")
+        messages, cursor = chatbot.get_history_since(session_id, view["cursor"])
+        if not messages:
+            return (gr.update() if view["text"] else EMPTY_HISTORY), view
         
-        return "\n---\n\n".join(formatted)
+        new_text = format_messages(messages, start=view["cursor"] + 1)
+        text = f"{view['text']}\n---\n\n{new_text}" if view["text"] else new_text
+        return text, dict(view, cursor=cursor, text=text)
     except Exception as e:
-        return f"Error loading history: {str(e)}"
+        return f"Error loading history: {str(e)}", view
+
+def show_full_resolution(request: gr.Request):
+    """Encode the full-resolution annotated image, only when asked for"""
+    path = chatbot.get_detection_preview(request.session_hash, full_resolution=True)
+    if path is None:
+        return gr.update(value=None, visible=False)
+    return gr.update(value=path, visible=True)
+
+def show_conversation_history(session_id=None):
+    """Display the full conversation history"""
+    text, _ = update_history(session_id, None)
+    return text
 
 def clear_chat():
     """Clear the chat interface"""
-    return [], "", "Chat cleared. Conversation history reset."
+    return [], "", "Chat cleared. Conversation history reset.", new_history_view()
 
-def refresh_history():
+def refresh_history(view, request: gr.Request):
     """Refresh conversation history"""
-    return show_conversation_history()
+    return update_history(request.session_hash, view)
 
 # Create Gradio interface
 with gr.Blocks(theme=gr.themes.Soft(), title="Image Recognition Chatbot", css="""
@@ -115,7 +194,8 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Image Recognition Chatbot", css=""
         with gr.Column(scale=1):
             image_input = gr.Image(
                 label="📤 Upload Image", 
-                type="numpy",
+                type="filepath",
+                image_mode=None,  # Hand over the uploaded file instead of a converted copy
                 height=300
             )
             upload_btn = gr.Button(
@@ -133,8 +213,11 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Image Recognition Chatbot", css=""
         with gr.Column(scale=1):
             annotated_output = gr.Image(
                 label="🎯 Detected Objects",
+                type="filepath",
                 height=300
             )
+            full_res_btn = gr.Button("🔎 Full Resolution", size="sm")
+            full_res_file = gr.File(label="Full-resolution annotated image", visible=False)
             gr.Markdown("""
             **Detection Info:**
             Bounding boxes show objects with labels and confidence scores.
@@ -223,33 +306,49 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Image Recognition Chatbot", css=""
     </div>
     """)
     
+    # Rendered history and its cursor, so each turn only formats new messages
+    history_view = gr.State(new_history_view())
+    
     # Event handlers
     upload_btn.click(
         fn=process_image,
-        inputs=[image_input],
-        outputs=[annotated_output, initial_response, chatbot_interface, history_output]
+        inputs=[image_input, history_view],
+        outputs=[annotated_output, initial_response, chatbot_interface, history_output, history_view],
+        api_name="process_image"
+    )
+    
+    upload_btn.click(
+        fn=lambda: gr.update(value=None, visible=False),
+        outputs=[full_res_file]
+    )
+    
+    full_res_btn.click(
+        fn=show_full_resolution,
+        outputs=[full_res_file]
     )
     
     send_btn.click(
         fn=chat_with_image,
-        inputs=[msg_input, chatbot_interface],
-        outputs=[chatbot_interface, msg_input, history_output]
+        inputs=[msg_input, chatbot_interface, history_view],
+        outputs=[chatbot_interface, msg_input, history_output, history_view],
+        api_name="chat"
     )
     
     msg_input.submit(
         fn=chat_with_image,
-        inputs=[msg_input, chatbot_interface],
-        outputs=[chatbot_interface, msg_input, history_output]
+        inputs=[msg_input, chatbot_interface, history_view],
+        outputs=[chatbot_interface, msg_input, history_output, history_view]
     )
     
     clear_btn.click(
         fn=clear_chat,
-        outputs=[chatbot_interface, msg_input, history_output]
+        outputs=[chatbot_interface, msg_input, history_output, history_view]
     )
     
     refresh_history_btn.click(
         fn=refresh_history,
-        outputs=[history_output]
+        inputs=[history_view],
+        outputs=[history_output, history_view]
     )
 
 if __name__ == "__main__":
@@ -257,11 +356,28 @@ if __name__ == "__main__":
     print("🚀 Starting Gradio Interface...")
     print("="*60 + "\n")
     
-    demo.queue()  # Enable queue for better handling
-    demo.launch(
-        share=False,
-        server_name="127.0.0.1",
-        server_port=7860,
-        show_error=True,
-        inbrowser=True  # Auto-open browser
-    )
\ No newline at end of file
+    # Let Gradio hand requests through; the scheduler (or pool) enforces the real limits
+    if Config.WORKER_PROCESSES > 0:
+        concurrency = Config.WORKER_PROCESSES * Config.WORKER_MAX_INFLIGHT
+    else:
+        concurrency = (Config.SCHEDULER_VISION_CONCURRENCY
+                       + Config.SCHEDULER_CHAT_CONCURRENCY + Config.SCHEDULER_MAX_QUEUED)
+    demo.queue(default_concurrency_limit=concurrency)
+    
+    if Config.API_ENABLED:
+        # Serve the JSON API and the UI from one process so they share the loaded models
+        import uvicorn
+        from api import create_api
+        
+        server = gr.mount_gradio_app(create_api(chatbot, scheduler), demo, path="/")
+        print("JSON API available under http://127.0.0.1:7860/v1/")
+        uvicorn.run(server, host="127.0.0.1", port=7860)
+    else:
+        demo.launch(
+            share=False,
+            server_name="127.0.0.1",
+            server_port=7860,
+            show_error=True,
+            allowed_paths=[Config.PREVIEW_CACHE_DIR],
+            inbrowser=True  # Auto-open browser
+        )
\ No newline at end of file
@@ -9,17 +9,135 @@ class Config:
     
     # Model Configurations
     YOLO_MODEL = "yolov8x.pt"  # Use yolov8x for best accuracy
+    YOLO_MODEL_TIERS = {  # Fastest to most accurate, loaded on first use
+        "n": "yolov8n.pt",
+        "s": "yolov8s.pt",
+        "m": "yolov8m.pt",
+        "x": YOLO_MODEL,
+    }
+    YOLO_DEFAULT_TIER = "x"
     BLIP_MODEL = "Salesforce/blip2-opt-2.7b"  # or blip2-flan-t5-xl for better quality
     LLM_MODEL = "llama3-70b-8192"  # Groq's LLaMA 3 70B
+    LLM_BACKEND = "groq"  # "groq", "local", "stub" (offline, deterministic) or "router"
     
     # Detection Thresholds
     YOLO_CONFIDENCE = 0.5
     YOLO_IOU = 0.45
     
+    # Inference Backend
+    YOLO_BACKEND = "torch"  # "torch" or "onnx" (ONNX Runtime on CPU)
+    YOLO_IMGSZ = 640  # Network input size; ONNX inputs are letterboxed to it
+    YOLO_EXPORT_DIR = "model_cache/onnx"
+    WEIGHT_CACHE_ENABLED = True  # Load BLIP/YOLO from memory-mapped safetensors copies
+    WEIGHT_CACHE_DIR = "model_cache/weights"
+    ONNX_INTRA_OP_THREADS = os.cpu_count() or 1
+    ONNX_INTER_OP_THREADS = 1
+    TORCH_INTRA_OP_THREADS = os.cpu_count() or 1  # None keeps torch's default
+    TORCH_INTER_OP_THREADS = 1
+    BLIP_TORCH_COMPILE = False  # torch.compile BLIP-2's vision encoder and Q-Former
+    WARMUP_ON_STARTUP = True  # Run synthetic passes so the first request isn't slow
+    
+    # Tier Selection
+    YOLO_LATENCY_BUDGET_MS = None  # e.g. 300 to pick the largest tier expected to fit
+    YOLO_TIER_LATENCY_PRIORS_MS = {"n": 60, "s": 150, "m": 400, "x": 1200}  # CPU estimates, refined at runtime
+    YOLO_CASCADE = False  # Run a small tier first, escalate on borderline confidences
+    YOLO_CASCADE_TIER = "n"
+    YOLO_CASCADE_BORDERLINE = 0.25  # Confidences in [this, YOLO_CONFIDENCE) trigger escalation
+    
+    # Tiled Detection (small objects in high-resolution images)
+    YOLO_TILED_DETECTION = False
+    YOLO_TILE_SIZE = 640  # Tile edge length in source pixels
+    YOLO_TILE_OVERLAP = 0.2  # Fraction of overlap between neighbouring tiles
+    YOLO_TILE_MIN_IMAGE_SIZE = 1600  # Only tile when the long side is at least this
+    YOLO_TILE_MAX_OBJECTS = 3  # Only tile when the first pass finds fewer objects
+    
+    # Local LLM (LLM_BACKEND = "local", or the router's local side)
+    LOCAL_LLM_BACKEND = "openai_compatible"  # Or "llama_cpp" to run a GGUF model in-process
+    LOCAL_LLM_BASE_URL = "http://127.0.0.1:8080/v1"  # llama.cpp server, Ollama, vLLM, ...
+    LOCAL_LLM_MODEL = "qwen2.5-1.5b-instruct"
+    LOCAL_LLM_MODEL_PATH = "model_cache/llm/qwen2.5-1.5b-instruct-q4_k_m.gguf"
+    LOCAL_LLM_CONTEXT = 4096
+    LOCAL_LLM_THREADS = os.cpu_count() or 1
+    LOCAL_LLM_MAX_TOKENS = 256
+    LOCAL_LLM_TIMEOUT_S = 30
+    
+    # LLM Routing (LLM_BACKEND = "router")
+    ROUTER_LOCAL_BACKEND = "local"  # Short factual follow-ups
+    ROUTER_REMOTE_BACKEND = "groq"  # Everything else, and fallback for the local model
+    ROUTER_LOCAL_MAX_WORDS = 12
+    
     # Conversation Settings
     MAX_CONVERSATION_HISTORY = 10  # Keep last 10 messages
     TEMPERATURE = 0.7
     MAX_TOKENS = 1024
+    LOCAL_QUERY_FAST_PATH = True  # Answer counting/presence/location questions from detections
+    FAST_FIRST_RESPONSE = False  # Answer uploads with a template description; the LLM's follows
+    
+    # Video Analysis
+    VIDEO_SAMPLE_FPS = 2  # Frames per second taken from the clip
+    VIDEO_SCENE_THRESHOLD = 0.25  # Mean thumbnail difference that starts a new scene
+    VIDEO_REUSE_THRESHOLD = 0.02  # Below this a frame reuses the previous detections
+    VIDEO_BATCH_SIZE = 8  # Frames per batched YOLO pass
+    VIDEO_MAX_SCENES = 50  # Later scene changes extend the last scene
+    
+    # Speculative VQA (precompute answers to common follow-up questions)
+    VQA_PREFETCH_ENABLED = False
+    VQA_PREFETCH_IDLE_S = 0.5  # Only probe after this long without user requests
+    VQA_PREFETCH_PROBES = {  # name: (BLIP question, whole-word keywords of questions it answers)
+        "colors": ("What are the main colors in this image?", ["color", "colour", "colors", "colours"]),
+        "clothing": ("What is the person wearing?", ["wearing", "clothes", "clothing", "dressed", "outfit"]),
+        "expression": ("What expression does the person have?", ["expression", "emotion", "emotions", "smiling", "facial"]),
+        "background": ("What is in the background?", ["background", "behind"]),
+        "setting": ("Is this indoors or outdoors?", ["indoors", "outdoors", "inside or outside"]),
+        "time_of_day": ("What time of day is it?", ["time of day", "daytime", "night", "morning", "evening"]),
+    }
+    
+    # Near-duplicate reuse (resized / re-compressed re-uploads)
+    NEAR_DUPLICATE_REUSE = False  # Serves a similar earlier image's analysis; opt in
+    PHASH_MAX_DISTANCE = 5  # Max Hamming distance (of 64 bits) for pHash and dHash
+    NEAR_DUPLICATE_MEMORY_ENTRIES = 1000  # Analyses kept in memory when the result store is off
+    
+    # Persistence
+    RESULT_STORE_ENABLED = False  # Persist analyses and conversations across restarts
+    RESULT_STORE_DIR = "chatbot_store"  # SQLite database plus image blobs; may be shared by workers
+    
+    # Sessions (persisted to the result store, if enabled, before they are dropped)
+    SESSION_MAX_ACTIVE = 1000  # Sessions kept in memory; the least recently used are dropped
+    SESSION_IDLE_TIMEOUT_S = 3600  # Sessions unused this long are dropped
+    
+    # HTTP API
+    API_ENABLED = False  # Serve the JSON API from the Gradio process (app.py)
+    API_HOST = "127.0.0.1"
+    API_PORT = 8000  # Used when running api.py standalone
+    API_MAX_IMAGE_BYTES = 20 * 1024 * 1024
+    
+    # Scheduling (admission control for the UI and API)
+    SCHEDULER_VISION_CONCURRENCY = 1  # YOLO + BLIP work at once
+    SCHEDULER_CHAT_CONCURRENCY = 4  # LLM-only chat turns at once
+    SCHEDULER_MAX_QUEUED = 16  # Per class; beyond this requests are rejected (HTTP 429)
+    SCHEDULER_VISION_DEADLINE_S = 120  # Shed requests that can't start within this
+    SCHEDULER_CHAT_DEADLINE_S = 30
+    
+    # Model worker processes (front process routes sessions to them)
+    WORKER_PROCESSES = 0  # 0 runs the models in the UI/API process itself
+    WORKER_MAX_INFLIGHT = 8  # Requests per worker before its sessions spill to others
+    WORKER_CALL_THREADS = 8  # Per worker, for history/preview/status reads
+    WORKER_START_TIMEOUT_S = 600  # Model loading and warm-up
+    WORKER_RELEASE_TIMEOUT_S = 10  # Saving a session before it moves; it stays put if exceeded
+    
+    # Profiling (per-request stack samples, written as collapsed stacks)
+    PROFILE_SAMPLE_RATE = 0.0  # Fraction of requests profiled; 0 disables sampling
+    PROFILE_DIR = "profiles"
+    PROFILE_INTERVAL_MS = 5  # Stack sampling interval
+    PROFILE_TORCH_OPS = True  # Also record a torch op-level timing table
     
     # Image Processing
-    MAX_IMAGE_SIZE = (1280, 1280)
\ No newline at end of file
+    MAX_IMAGE_SIZE = (1280, 1280)
+    MAX_SOURCE_PIXELS = 50_000_000  # Non-JPEG uploads can't be decoded at reduced size
+    BLIP_IMAGE_SIZE = 224  # Square input of the BLIP-2 vision encoder
+    ANNOTATION_PREVIEW_SIZE = (600, 600)  # Annotated image shown in the UI (300px box at 2x DPI)
+    ANNOTATION_PREVIEW_FORMAT = "WEBP"  # WEBP or JPEG; full resolution downloads use the same
+    ANNOTATION_PREVIEW_QUALITY = 80
+    ANNOTATION_FULL_QUALITY = 92
+    PREVIEW_CACHE_DIR = "preview_cache"  # Encoded annotated images, shared by sessions and workers
+    PREVIEW_CACHE_MAX_FILES = 2000
\ No newline at end of file
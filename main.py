@@ -3,95 +3,643 @@ from models.blip_captioner import BLIPCaptioner
 from models.llm_conversational import ConversationalLLM
 from utils.image_processor import ImageProcessor
 from utils.prompt_builder import PromptBuilder
+from utils.result_store import ResultStore
+from utils.session import ImageSession
+from utils.vqa_prefetcher import VQAPrefetcher
+from utils.image_hash import NearDuplicateIndex
+from utils.video_processor import VideoAnalyzer
+from utils.profiling import request_profile
+from utils.detection_index import QueryInterpreter
+from utils.preview_cache import PreviewCache, detections_digest
+from utils.analysis_record import AnalysisRecord
+from utils.scheduler import QueueFull, DeadlineExceeded
+from config import Config
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from contextlib import nullcontext
+from PIL import Image
+from typing import Optional, Union, Iterator
+import threading
+import time
 import os
 
 class ConversationalImageChatbot:
-    def __init__(self):
-        """Initialize all components"""
+    DEFAULT_SESSION = "default"
+    OPENING_PROMPT = "Provide a brief, natural description of what you see in this image."
+    
+    def __init__(self, yolo=None, blip=None, llm=None):
+        """
+        Initialize all components
+        
+        yolo, blip and llm replace the default models, e.g. with lightweight
+        fakes for load testing
+        """
         print("Initializing Conversational Image Chatbot...")
         
-        self.yolo = YOLODetector()
+        self.yolo = yolo or YOLODetector()
         print("✓ YOLO detector loaded")
         
-        self.blip = BLIPCaptioner()
+        self.blip = blip or BLIPCaptioner()
         print("✓ BLIP-2 captioner loaded")
         
-        self.llm = ConversationalLLM()
+        self.llm = llm or ConversationalLLM()
         print("✓ LLM conversation model loaded")
         
+        if Config.WARMUP_ON_STARTUP:
+            print("Warming up models...")
+            for model in (self.yolo, self.blip):
+                if hasattr(model, "warmup"):
+                    model.warmup()
+            print("✓ Models warmed up")
+        
         self.image_processor = ImageProcessor()
         self.prompt_builder = PromptBuilder()
+        self.previews = PreviewCache()
+        self.video_analyzer = VideoAnalyzer(self.yolo, self.blip)
+        
+        # Optional persistence so sessions survive restarts
+        self.store = ResultStore() if Config.RESULT_STORE_ENABLED else None
+        if self.store:
+            print(f"✓ Result store at {self.store.store_dir}")
+        
+        # Perceptual-hash index of analyzed images for near-duplicate reuse
+        self.near_duplicates = None
+        self._recent_analyses = OrderedDict()
+        self._recent_lock = threading.Lock()  # Analyses are remembered from scheduler workers
+        if Config.NEAR_DUPLICATE_REUSE:
+            self.near_duplicates = NearDuplicateIndex()
+            if self.store:
+                for image_key, hashes, size in self.store.iter_image_hashes():
+                    self.near_duplicates.add(image_key, hashes, size)
+                print(f"✓ Near-duplicate index loaded ({len(self.near_duplicates)} images)")
+        
+        # Background BLIP VQA for likely follow-up questions
+        self.prefetcher = VQAPrefetcher(self.blip) if Config.VQA_PREFETCH_ENABLED else None
         
-        self.current_image_context = None
-        self.current_image_path = None
+        # The PipelineScheduler in front of this chatbot sets itself here; in
+        # fast-first-response mode it queues the LLM's opening responses
+        self.scheduler = None
+        
+        # Sessions by id, least recently used first; callers that don't pass one
+        # share the default session
+        self.sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
         
         print("\n🎉 Chatbot ready!\n")
     
-    def process_new_image(self, image_path: str) -> str:
+    def get_session(self, session_id: Optional[str] = None) -> ImageSession:
+        """
+        Get a session, rehydrating it from the result store on first access
+        """
+        session_id = session_id or self.DEFAULT_SESSION
+        with self._sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+                session.last_used = time.monotonic()
+        if session is not None:
+            return session
+        
+        # Store reads happen outside the lock so one rehydration doesn't hold up other sessions
+        loaded = self._load_session(session_id)
+        if loaded is None:
+            loaded, messages = ImageSession(session_id, self.llm.new_thread_id()), None
+        else:
+            loaded, messages = loaded
+        with self._sessions_lock:
+            session = self.sessions.setdefault(session_id, loaded)
+            # Only the request that inserted the session restores its memory, so history isn't doubled
+            if session is loaded and messages is not None:
+                self._restore_history(session, messages)
+        if session is loaded:
+            self._evict_sessions()
+        return session
+    
+    def _evict_sessions(self):
+        """
+        Drop sessions beyond SESSION_MAX_ACTIVE or idle past SESSION_IDLE_TIMEOUT_S
+        
+        Least recently used go first. Sessions still waiting on their opening
+        response, and the default session, are kept. With the result store
+        enabled, dropped sessions are saved and rehydrate on their next request.
+        """
+        now = time.monotonic()
+        evicted = []
+        with self._sessions_lock:
+            for session_id, session in list(self.sessions.items()):
+                over_limit = len(self.sessions) > Config.SESSION_MAX_ACTIVE
+                if not over_limit and now - session.last_used < Config.SESSION_IDLE_TIMEOUT_S:
+                    break
+                if session_id == self.DEFAULT_SESSION or (
+                    session.pending_response is not None and not session.pending_response.done()
+                ):
+                    continue
+                del self.sessions[session_id]
+                evicted.append(session)
+        
+        for session in evicted:
+            self._save_session(session)
+            self.llm.discard_history(session.thread_id)
+    
+    def session_info(self, session_id: Optional[str] = None) -> dict:
+        """
+        Plain-data summary of a session's analysis
+        
+        Unlike the ImageSession itself it can be sent to another process.
+        """
+        session = self.get_session(session_id)
+        return {
+            'session_id': session.session_id,
+            'thread_id': session.thread_id,
+            'image_key': session.image_key,
+            'caption': session.blip_caption,
+            'total_objects': session.analysis.total_objects if session.analysis else 0,
+            'detections': session.analysis.detections if session.analysis else [],
+            'has_context': session.has_context,
+            # The LLM's description is still coming (fast-first-response mode)
+            'response_pending': (
+                session.pending_response is not None and not session.pending_response.done()
+            ),
+        }
+    
+    def release_session(self, session_id: str):
+        """
+        Persist a session and drop it from memory
+        
+        Used when another worker process takes the session over; it
+        rehydrates the session from the result store on first access.
+        """
+        with self._sessions_lock:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        self._await_opening_response(session)
+        self._save_session(session)
+        if self.store:
+            self.store.flush()
+        self.llm.discard_history(session.thread_id)
+    
+    def _load_session(self, session_id: str) -> Optional[tuple]:
+        """Rebuild a session from the store, returning it and its saved messages"""
+        if not self.store:
+            return None
+        
+        record = self.store.load_session(session_id)
+        if record is None:
+            return None
+        
+        session = ImageSession(session_id, record['thread_id'])
+        analysis = self.store.load_image(record['image_key']) if record['image_key'] else None
+        if analysis:
+            self._apply_analysis(session, analysis)
+        elif record['video']:
+            session.image_path = record['video']['keyframe_path']
+            session.video_caption = record['video']['caption']
+            session.video_context = record['video']['context']
+        return session, record['messages']
+    
+    def _restore_history(self, session: ImageSession, messages: list):
+        """Load a rehydrated session's saved conversation into the LLM's memory"""
+        self.llm.restore_history(session.thread_id, messages, session.image_context or "")
+        print(f"Restored session '{session.session_id}' ({len(messages)} messages)")
+    
+    def _apply_analysis(self, session: ImageSession, analysis: dict):
+        """Attach a stored or fresh image analysis to a session"""
+        session.image_key = analysis['image_key']
+        session.image_path = analysis['image_path']
+        session.image = analysis.get('image')
+        session.analysis = analysis['record']
+        session.video_caption = None
+        session.video_context = None
+    
+    def _find_near_duplicate(self, hashes, size) -> Optional[dict]:
+        """Analysis of a similar earlier image, rescaled to this image's size"""
+        # Closest first; a match whose analysis is gone falls through to the next one
+        for match_key in self.near_duplicates.find(hashes, size):
+            if self.store:
+                stored = self.store.load_image(match_key)
+                record = stored['record'] if stored else None
+            else:
+                with self._recent_lock:
+                    data = self._recent_analyses.get(match_key)
+                record = AnalysisRecord.from_bytes(data) if data else None
+            if record is not None:
+                return {'record': record.rescaled(size)}
+        return None
+    
+    def _remember_analysis(self, analysis: dict, processed, hashes=None):
+        """Make an analysis reusable for exact and near-duplicate re-uploads"""
+        image_key = analysis['image_key']
+        
+        if self.near_duplicates is not None:
+            if hashes is None:
+                hash_image = processed if isinstance(processed, Image.Image) else Image.open(processed)
+                hashes = self.near_duplicates.hashes(hash_image)
+            self.near_duplicates.add(image_key, hashes, analysis['record'].image_size)
+        
+        if self.store:
+            self.store.save_image_async(image_key, processed, analysis['record'], hashes=hashes)
+        elif self.near_duplicates is not None:
+            # Without a store, keep a bounded set of recent analyses in memory, serialized
+            data = analysis['record'].to_bytes()
+            with self._recent_lock:
+                self._recent_analyses[image_key] = data
+                while len(self._recent_analyses) > Config.NEAR_DUPLICATE_MEMORY_ENTRIES:
+                    evicted_key, _ = self._recent_analyses.popitem(last=False)
+                    self.near_duplicates.remove(evicted_key)
+    
+    def _save_session(self, session: ImageSession):
+        """Persist a session's conversation off the request path"""
+        if self.store:
+            video = None
+            if session.video_context is not None:
+                video = {
+                    'caption': session.video_caption,
+                    'context': session.video_context,
+                    'keyframe': session.image_input,
+                }
+            self.store.save_session_async(
+                session.session_id,
+                session.image_key,
+                session.thread_id,
+                self.llm.get_conversation_history(session.thread_id),
+                video=video
+            )
+    
+    # Accessors for the default session, used by the CLI and Gradio app
+    @property
+    def current_image_context(self):
+        return self.get_session().image_context
+    
+    @property
+    def current_image_path(self):
+        return self.get_session().image_path
+    
+    @property
+    def current_yolo_results(self):
+        return self.get_session().yolo_results
+    
+    def _foreground(self):
+        """Context for user requests; pauses background prefetching"""
+        return self.prefetcher.foreground() if self.prefetcher else nullcontext()
+    
+    def process_new_image(self, image: Union[str, bytes], session_id: Optional[str] = None,
+                          profile: Optional[bool] = None) -> str:
         """
         Process a new image and generate initial analysis
+        
+        image is a file path, or encoded image bytes that are processed
+        entirely in memory. profile forces (or suppresses) a profile of the
+        request; by default Config.PROFILE_SAMPLE_RATE decides.
         """
+        with request_profile("image", profile), self._foreground():
+            response = self._process_new_image(image, session_id)
+        
+        if self.prefetcher and self.get_session(session_id).has_context:
+            self.prefetcher.schedule(self.get_session(session_id))
+        return response
+    
+    def _process_new_image(self, image: Union[str, bytes], session_id: Optional[str]) -> str:
         # Validate image
-        if not self.image_processor.validate_image(image_path):
+        if not self.image_processor.validate_image(image):
             return "Error: Invalid image file."
         
-        # Preprocess image
-        processed_path = self.image_processor.preprocess_image(image_path)
-        self.current_image_path = processed_path
+        session = self.get_session(session_id)
+        
+        # Preprocess image: one reduced-resolution decode feeds everything below
+        try:
+            processed_image = self.image_processor.load(image)
+        except Exception as e:
+            return f"Error: Could not read image ({e})."
+        processed_path = None
+        if not isinstance(image, bytes):
+            processed_path = self.image_processor.save_processed(image, processed_image)
+        session.source = image
+        session.model_inputs = self.image_processor.model_inputs(processed_image)
+        session.vqa_answers = {}
+        session.pending_response = None
         
         # Reset conversation for new image
-        self.llm.reset_memory()
+        self.llm.discard_history(session.thread_id)
+        session.thread_id = self.llm.reset_memory()
         
-        print("Analyzing image...")
+        # Reuse a stored analysis of the same image if there is one
+        image_key = ResultStore.image_key(image if processed_path is None else processed_path)
+        analysis = self.store.load_image(image_key) if self.store else None
+        hashes = None
         
-        # Run YOLO detection
-        print("- Running object detection...")
-        yolo_results = self.yolo.detect_objects(processed_path)
+        # Otherwise look for a near-duplicate (resized, re-compressed, screenshot)
+        if analysis is None and self.near_duplicates is not None:
+            hashes = self.near_duplicates.hashes(processed_image)
+            analysis = self._find_near_duplicate(hashes, processed_image.size)
+            if analysis:
+                print("Reusing analysis of a near-duplicate image...")
+                analysis['image_key'] = image_key
+                analysis['record'].image_key = image_key
+                self._remember_analysis(analysis, processed_image, hashes)
+        elif analysis:
+            print("Reusing stored analysis...")
+        
+        if analysis:
+            analysis['image_path'] = processed_path or analysis.get('image_path')
+            analysis['image'] = processed_image
+            self._apply_analysis(session, analysis)
+        else:
+            print("Analyzing image...")
+            
+            # Run YOLO detection on the YOLO-sized input, reported at the preprocessed size
+            print("- Running object detection...")
+            yolo_results = self.yolo.detect_objects(session.model_inputs['yolo'], source=image)
+            if yolo_results['image_size'] != processed_image.size:
+                yolo_results = self.yolo.rescale_results(yolo_results, processed_image.size)
+            print(f"  (tier '{yolo_results['tier']}', {yolo_results['latency_ms']:.0f} ms)")
+            
+            # Generate BLIP caption
+            print("- Generating image caption...")
+            blip_caption = self.blip.generate_caption(session.model_inputs['blip'])
+            
+            # The context for the LLM is derived from the record when needed
+            analysis = {
+                'image_key': image_key,
+                'image_path': processed_path,
+                'image': processed_image,
+                'record': AnalysisRecord.from_yolo_results(yolo_results, blip_caption, image_key),
+            }
+            self._apply_analysis(session, analysis)
+            self._remember_analysis(analysis, processed_image, hashes)
         
-        # Generate BLIP caption
-        print("- Generating image caption...")
-        blip_caption = self.blip.generate_caption(processed_path)
+        # Generate initial response
+        if Config.FAST_FIRST_RESPONSE and self.scheduler is not None:
+            # Reply from local inference now; the LLM's description follows as a
+            # scheduled chat turn, so it shares admission and limits with the others
+            thread_id, image_context = session.thread_id, session.image_context
+            try:
+                session.pending_response = self.scheduler.submit_chat(
+                    self.OPENING_PROMPT, session.session_id,
+                    fn=lambda: self._generate_opening_response(session, thread_id, image_context)
+                )
+            except (QueueFull, DeadlineExceeded) as e:
+                print(f"Opening response skipped: {e}")
+            return self.prompt_builder.build_quick_description(
+                session.yolo_results, session.blip_caption
+            )
         
-        # Build context
-        self.current_image_context = self.prompt_builder.build_image_context(
-            yolo_results, blip_caption
+        response = self.llm.generate_response(
+            self.OPENING_PROMPT, session.image_context, thread_id=session.thread_id
         )
+        self._save_session(session)
         
-        # Generate initial response
-        initial_prompt = "Provide a brief, natural description of what you see in this image."
-        response = self.llm.generate_response(initial_prompt, self.current_image_context)
+        return response
+    
+    def _generate_opening_response(self, session: ImageSession, thread_id: str,
+                                   image_context: str) -> str:
+        response = self.llm.generate_response(self.OPENING_PROMPT, image_context, thread_id=thread_id)
+        # A newer upload may have replaced the conversation in the meantime
+        if session.thread_id == thread_id:
+            self._save_session(session)
+        return response
+    
+    def get_opening_response(self, session_id: Optional[str] = None,
+                             timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Wait for the LLM's opening response in fast-first-response mode
+        
+        Returns None if there is none pending or it failed; the template
+        description returned by process_new_image then stands.
+        """
+        pending = self.get_session(session_id).pending_response
+        if pending is None:
+            return None
+        try:
+            return pending.result(timeout)
+        except Exception as e:
+            print(f"Opening response unavailable: {e}")
+            return None
+    
+    def _await_opening_response(self, session: ImageSession):
+        """Keep the opening turn ahead of the user's first question in memory"""
+        pending = session.pending_response
+        if pending is None:
+            return
+        if pending.cancel():
+            # Still queued, possibly behind the chat worker calling this; run it here
+            response = Future()
+            response.set_result(
+                self._generate_opening_response(session, session.thread_id, session.image_context)
+            )
+            session.pending_response = response
+        else:
+            wait([pending])
+    
+    def process_new_video(self, video_path: str, session_id: Optional[str] = None) -> str:
+        """
+        Process a video clip and generate an initial summary
         
+        The clip is analyzed into a scene timeline that becomes the session's
+        context; the keyframe of the longest scene serves follow-up VQA.
+        """
+        with self._foreground():
+            session = self.get_session(session_id)
+            
+            print("Analyzing video...")
+            try:
+                video_results = self.video_analyzer.analyze(video_path)
+            except ValueError as e:
+                return f"Error: {e}"
+            if not video_results['segments']:
+                return "Error: No frames could be read from the video."
+            
+            print(f"- {video_results['frames_sampled']} frames sampled, "
+                  f"{len(video_results['segments'])} scenes, "
+                  f"{video_results['frames_reused']} frames reused")
+            
+            # Reset conversation for the new clip
+            self.llm.discard_history(session.thread_id)
+            session.thread_id = self.llm.reset_memory()
+            session.image_key = None
+            session.image_path = None
+            session.image = video_results['keyframe']
+            session.model_inputs = {}
+            session.source = None
+            session.analysis = None
+            session.video_caption = video_results['segments'][0]['caption']
+            session.video_context = self.prompt_builder.build_video_context(video_results)
+            session.vqa_answers = {}
+            session.pending_response = None
+            
+            initial_prompt = "Provide a brief, natural summary of what happens in this video clip."
+            response = self.llm.generate_response(
+                initial_prompt, session.image_context, thread_id=session.thread_id
+            )
+        
+        self._save_session(session)
         return response
     
-    def chat(self, user_message: str) -> str:
+    def needs_visual_answer(self, user_message: str, session: Optional[ImageSession] = None) -> bool:
         """
-        Continue conversation about the current image
+        Check if question is very specific (might need BLIP VQA)
+        
+        Questions already answered by a prefetched probe don't need a live VQA pass
         """
-        if self.current_image_context is None:
-            return "Please upload an image first."
+        if session is not None and self.prefetcher and self.prefetcher.match(session, user_message):
+            return False
+        return any(word in user_message.lower() for word in ['color', 'wearing', 'doing', 'expression'])
+    
+    def _build_prompt(self, session: ImageSession, user_message: str) -> str:
+        """Turn a user message into the LLM prompt, adding BLIP VQA where useful"""
+        prefetched = self.prefetcher.match(session, user_message) if self.prefetcher else None
+        if prefetched:
+            return f"The visual analysis says: '{prefetched}'. Provide a natural response to: {user_message}"
+        
+        # A probe on the same topic ("main colors" for "What color is the car?")
+        # can't answer the question, but is worth passing along
+        related = self.prefetcher.related(session, user_message) if self.prefetcher else None
+        observation = f" A related observation about the image: '{related}'." if related else ""
         
-        # Check if question is very specific (might need BLIP VQA)
-        if any(word in user_message.lower() for word in ['color', 'wearing', 'doing', 'expression']):
+        if self.needs_visual_answer(user_message):
             # Use BLIP VQA for specific visual questions
-            blip_answer = self.blip.answer_question(self.current_image_path, user_message)
+            blip_answer = self.blip.answer_question(session.blip_input, user_message)
             # Enhance with LLM
-            enhanced_prompt = f"The visual analysis says: '{blip_answer}'. Provide a natural response to: {user_message}"
-            response = self.llm.generate_response(enhanced_prompt, self.current_image_context)
-        else:
-            # Use LLM with context for general questions
-            response = self.llm.generate_response(user_message, self.current_image_context)
+            return (f"The visual analysis says: '{blip_answer}'.{observation} "
+                    f"Provide a natural response to: {user_message}")
+        
+        # Use LLM with context for general questions
+        if observation:
+            return f"{observation.strip()} Provide a natural response to: {user_message}"
+        return user_message
+    
+    def _answer_locally(self, session: ImageSession, user_message: str) -> Optional[str]:
+        """
+        Answer counting, presence and location questions from the detections
+        
+        The exchange is recorded in the conversation like an LLM turn. Returns
+        None for questions that need the LLM.
+        """
+        if not Config.LOCAL_QUERY_FAST_PATH or session.detection_index is None:
+            return None
+        answer = QueryInterpreter(session.detection_index).answer(user_message)
+        if answer is not None:
+            self.llm.record_exchange(
+                session.thread_id, user_message, answer, session.image_context
+            )
+            self._save_session(session)
+        return answer
+    
+    def chat(self, user_message: str, session_id: Optional[str] = None,
+             profile: Optional[bool] = None, backend: Optional[str] = None) -> str:
+        """
+        Continue conversation about the current image
+        
+        backend picks the LLM backend for this turn (see models.llm_backends)
+        """
+        session = self.get_session(session_id)
+        if not session.has_context:
+            return "Please upload an image first."
+        
+        self._await_opening_response(session)
+        local_answer = self._answer_locally(session, user_message)
+        if local_answer is not None:
+            return local_answer
+        
+        with request_profile("chat", profile), self._foreground():
+            prompt = self._build_prompt(session, user_message)
+            response = self.llm.generate_response(
+                prompt, session.image_context, thread_id=session.thread_id, backend=backend,
+                user_question=user_message
+            )
         
+        self._save_session(session)
         return response
     
-    def get_detection_visualization(self):
-        """Return the annotated image with bounding boxes"""
-        if self.current_image_path:
-            yolo_results = self.yolo.detect_objects(self.current_image_path)
-            return yolo_results['annotated_image']
+    def chat_stream(self, user_message: str, session_id: Optional[str] = None,
+                    profile: Optional[bool] = None, backend: Optional[str] = None) -> Iterator[str]:
+        """
+        Continue conversation about the current image, yielding the response
+        as it is generated
+        """
+        session = self.get_session(session_id)
+        if not session.has_context:
+            yield "Please upload an image first."
+            return
+        
+        self._await_opening_response(session)
+        local_answer = self._answer_locally(session, user_message)
+        if local_answer is not None:
+            yield local_answer
+            return
+        
+        with request_profile("chat_stream", profile), self._foreground():
+            prompt = self._build_prompt(session, user_message)
+            yield from self.llm.stream_response(
+                prompt, session.image_context, thread_id=session.thread_id, backend=backend,
+                user_question=user_message
+            )
+        
+        self._save_session(session)
+    
+    def get_conversation_history(self, session_id: Optional[str] = None) -> list:
+        """Get the conversation history of a session"""
+        return self.llm.get_conversation_history(self.get_session(session_id).thread_id)
+    
+    def get_history_since(self, session_id: Optional[str] = None, cursor: int = 0):
+        """
+        Messages added to a session's conversation after cursor, and the new cursor
+        
+        The cursor restarts at 0 whenever a new image starts a new thread;
+        compare the session's thread_id to detect that.
+        """
+        return self.llm.get_history_since(self.get_session(session_id).thread_id, cursor)
+    
+    def get_detection_visualization(self, max_size=None, session_id: Optional[str] = None):
+        """
+        Render the annotated image (RGB) with bounding boxes on demand
+        
+        Reuses the detections from process_new_image; max_size gives a
+        downscaled preview.
+        """
+        session = self.get_session(session_id)
+        if session.image_input is not None and session.analysis is not None:
+            return self.yolo.render_annotations(
+                session.image_input,
+                session.analysis.detections,
+                max_size=max_size
+            )
         return None
+    
+    def get_detection_preview(self, session_id: Optional[str] = None,
+                              full_resolution: bool = False) -> Optional[str]:
+        """
+        Path of the encoded annotated image, rendered once per image
+        
+        The default is a preview bounded by Config.ANNOTATION_PREVIEW_SIZE;
+        full_resolution renders the whole processed image and is meant for
+        explicit requests only.
+        """
+        session = self.get_session(session_id)
+        if session.image_input is None or session.analysis is None or session.image_key is None:
+            return None
+        
+        detections = session.analysis.detections
+        max_size = None if full_resolution else Config.ANNOTATION_PREVIEW_SIZE
+        size_label = "full" if full_resolution else f"{max_size[0]}x{max_size[1]}"
+        key = f"{session.image_key}-{detections_digest(detections)}-{size_label}"
+        
+        return self.previews.get(
+            key,
+            lambda: self.yolo.render_annotations(session.image_input, detections, max_size=max_size),
+            quality=Config.ANNOTATION_FULL_QUALITY if full_resolution else None
+        )
 
 # CLI Interface
 def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Conversational image chatbot (CLI)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Profile every request into {Config.PROFILE_DIR}/")
+    args = parser.parse_args()
+    if args.profile:
+        Config.PROFILE_SAMPLE_RATE = 1.0
+    
     chatbot = ConversationalImageChatbot()
     
     print("=" * 60)
@@ -103,17 +651,29 @@ def main():
         print("1. Upload new image")
         print("2. Ask question about current image")
         print("3. Exit")
+        print("4. Upload video clip")
         
-        choice = input("\nEnter choice (1-3): ").strip()
+        choice = input("\nEnter choice (1-4): ").strip()
         
         if choice == "1":
             image_path = input("Enter image path: ").strip()
             if os.path.exists(image_path):
                 response = chatbot.process_new_image(image_path)
                 print(f"\n🤖 Bot: {response}")
+                polished = chatbot.get_opening_response()
+                if polished:
+                    print(f"\n🤖 Bot: {polished}")
             else:
                 print("❌ Image file not found!")
         
+        elif choice == "4":
+            video_path = input("Enter video path: ").strip()
+            if os.path.exists(video_path):
+                response = chatbot.process_new_video(video_path)
+                print(f"\n🤖 Bot: {response}")
+            else:
+                print("❌ Video file not found!")
+        
         elif choice == "2":
             if chatbot.current_image_context is None:
                 print("❌ Please upload an image first!")
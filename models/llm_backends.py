@@ -0,0 +1,135 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from typing import List, Optional, Sequence
+import re
+from config import Config
+
+class StubChatModel(BaseChatModel):
+    """
+    Deterministic offline chat model
+
+    Replies with the scene description from the system prompt and echoes
+    the question, so conversations work without network access or weights.
+    """
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        system = next((m.content for m in messages if isinstance(m, SystemMessage)), "")
+        scene = re.search(r"Overall Scene Description: (.*)", system)
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        description = scene.group(1).strip() if scene else "no image description is available"
+        return f"From the image analysis: {description}. (Question: {question})"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for word in self._reply(messages).split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+def _create_groq() -> BaseChatModel:
+    from langchain_groq import ChatGroq
+    return ChatGroq(
+        groq_api_key=Config.GROQ_API_KEY,
+        model_name=Config.LLM_MODEL,
+        temperature=Config.TEMPERATURE,
+        max_tokens=Config.MAX_TOKENS
+    )
+
+def _create_openai_compatible() -> BaseChatModel:
+    """A local server speaking the OpenAI API (llama.cpp server, Ollama, vLLM)"""
+    try:
+        from langchain_openai import ChatOpenAI
+    except ImportError:
+        raise ImportError("The local OpenAI-compatible backend needs: pip install langchain-openai")
+    return ChatOpenAI(
+        base_url=Config.LOCAL_LLM_BASE_URL,
+        api_key="not-needed",
+        model=Config.LOCAL_LLM_MODEL,
+        temperature=Config.TEMPERATURE,
+        max_tokens=Config.LOCAL_LLM_MAX_TOKENS,
+        timeout=Config.LOCAL_LLM_TIMEOUT_S
+    )
+
+def _create_llama_cpp() -> BaseChatModel:
+    """A quantized GGUF model run in-process on the CPU"""
+    try:
+        from langchain_community.chat_models import ChatLlamaCpp
+    except ImportError:
+        raise ImportError(
+            "The in-process local backend needs: pip install langchain-community llama-cpp-python"
+        )
+    return ChatLlamaCpp(
+        model_path=Config.LOCAL_LLM_MODEL_PATH,
+        n_ctx=Config.LOCAL_LLM_CONTEXT,
+        n_threads=Config.LOCAL_LLM_THREADS,
+        temperature=Config.TEMPERATURE,
+        max_tokens=Config.LOCAL_LLM_MAX_TOKENS,
+        verbose=False
+    )
+
+BACKENDS = {
+    "groq": _create_groq,
+    "stub": StubChatModel,
+    "openai_compatible": _create_openai_compatible,
+    "llama_cpp": _create_llama_cpp,
+}
+
+def create_backend(name: str) -> BaseChatModel:
+    """
+    Build a chat model by backend name
+
+    "local" means whichever local backend Config.LOCAL_LLM_BACKEND names.
+    """
+    if name == "local":
+        name = Config.LOCAL_LLM_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}' (choose from {', '.join(BACKENDS)}, local)")
+    return BACKENDS[name]()
+
+class LLMRouter:
+    """
+    Chooses between the local and remote backend for each turn
+
+    Short factual follow-ups (what/where/which/how many/is there..., under
+    Config.ROUTER_LOCAL_MAX_WORDS words) go to the local model; explanations,
+    comparisons, creative requests and anything long go to the remote model.
+    """
+
+    FACTUAL_START = re.compile(
+        r"^(what|where|which|who|how many|how much|is|are|does|do|can|was|were|name)\b"
+    )
+    COMPLEX_WORDS = re.compile(
+        r"\b(why|explain|describe|compare|difference|story|poem|imagine|analy[sz]e|"
+        r"suggest|recommend|opinion|think|feel|mood|meaning|summari[sz]e)\b"
+    )
+
+    def __init__(self, local: str = None, remote: str = None):
+        self.local = local or Config.ROUTER_LOCAL_BACKEND
+        self.remote = remote or Config.ROUTER_REMOTE_BACKEND
+
+    def route(self, messages: Sequence[BaseMessage], question: Optional[str] = None) -> str:
+        """
+        Backend name for the turn ending with the latest user message
+
+        question is the user's own words when the latest message wraps them
+        in a prompt (e.g. with a VQA answer); it is classified instead.
+        """
+        if question is None:
+            question = next(
+                (m.content for m in reversed(messages) if isinstance(m, HumanMessage)), ""
+            )
+        question = question.strip().lower()
+
+        if (len(question.split()) <= Config.ROUTER_LOCAL_MAX_WORDS
+                and self.FACTUAL_START.match(question)
+                and not self.COMPLEX_WORDS.search(question)):
+            return self.local
+        return self.remote
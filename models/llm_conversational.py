@@ -1,11 +1,14 @@
-from langchain_groq import ChatGroq
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, Annotated, Sequence
+from typing import TypedDict, Annotated, Sequence, Optional, List, Dict, Iterator, Tuple
 from langchain_core.messages import BaseMessage
 import operator
+import threading
+import uuid
 from config import Config
+from models.llm_backends import create_backend, LLMRouter
 
 class ConversationState(TypedDict):
     """State for conversation graph"""
@@ -13,18 +16,37 @@ class ConversationState(TypedDict):
     image_context: str
 
 class ConversationalLLM:
-    def __init__(self):
-        """Initialize LLM with LangGraph memory"""
-        self.llm = ChatGroq(
-            groq_api_key=Config.GROQ_API_KEY,
-            model_name=Config.LLM_MODEL,
-            temperature=Config.TEMPERATURE,
-            max_tokens=Config.MAX_TOKENS
+    def __init__(self, llm=None, backend: Optional[str] = None):
+        """
+        Initialize LLM with LangGraph memory
+        
+        llm is any LangChain chat model to use by default. Otherwise backend
+        names one from models.llm_backends (Config.LLM_BACKEND if omitted),
+        or "router" to choose between local and remote models per turn.
+        """
+        self.backends = {}
+        self._backends_lock = threading.Lock()
+        self.router = LLMRouter()
+        
+        if llm is not None:
+            self.backends["custom"] = llm
+            self.default_backend = "custom"
+        else:
+            self.default_backend = backend or Config.LLM_BACKEND
+        
+        # Load the default model up front so configuration errors show at startup
+        self.llm = (
+            self.get_backend(self.default_backend) if self.default_backend != "router" else None
         )
         
         # Initialize memory saver
         self.memory = MemorySaver()
         
+        # Append-only transcript per thread, mirroring the graph's messages so
+        # history reads don't fetch and re-wrap the whole state snapshot
+        self._transcripts: Dict[str, List[Dict]] = {}
+        self._transcript_lock = threading.Lock()
+        
         # System prompt template
         self.system_prompt = """You are an intelligent image analysis assistant. You have access to detailed information about an image including object detection data and image descriptions.
 
@@ -47,7 +69,7 @@ Instructions:
     def _build_graph(self):
         """Build LangGraph for conversation with memory"""
         
-        def chatbot_node(state: ConversationState):
+        def chatbot_node(state: ConversationState, config: RunnableConfig):
             """Process messages through LLM"""
             # Get image context
             image_context = state.get("image_context", "No image context available.")
@@ -63,8 +85,11 @@ Instructions:
             # Combine system message with conversation
             full_messages = [system_msg] + list(messages)
             
-            # Get LLM response
-            response = self.llm.invoke(full_messages)
+            # Get LLM response from the backend chosen for this request
+            configurable = config.get("configurable", {})
+            response = self._select_backend(
+                configurable.get("llm_backend"), messages, configurable.get("user_question")
+            ).invoke(full_messages)
             
             return {"messages": [response]}
         
@@ -77,15 +102,47 @@ Instructions:
         # Compile with memory
         return workflow.compile(checkpointer=self.memory)
     
-    def generate_response(self, user_query: str, image_context: str) -> str:
+    def get_backend(self, name: str):
+        """Chat model for a backend name, created on first use"""
+        with self._backends_lock:
+            if name not in self.backends:
+                print(f"Loading LLM backend '{name}'...")
+                self.backends[name] = create_backend(name)
+            return self.backends[name]
+    
+    def _select_backend(self, name: Optional[str], messages, question: Optional[str] = None):
+        """Resolve a per-request backend name (or the default) to a chat model"""
+        name = name or self.default_backend
+        if name != "router":
+            return self.get_backend(name)
+        
+        name = self.router.route(messages, question)
+        model = self.get_backend(name)
+        if name != self.router.remote:
+            # A local model that is down or overloaded shouldn't fail the turn
+            return model.with_fallbacks([self.get_backend(self.router.remote)])
+        return model
+    
+    def generate_response(self, user_query: str, image_context: str,
+                          thread_id: Optional[str] = None, backend: Optional[str] = None,
+                          user_question: Optional[str] = None) -> str:
         """
         Generate conversational response using image context and chat history
+        
+        thread_id selects the conversation; defaults to the current thread.
+        backend overrides the default LLM backend for this turn.
+        user_question is the user's own words when user_query is a prompt
+        built around them; the router classifies it instead of the prompt.
         """
         # Create user message
         user_message = HumanMessage(content=user_query)
         
         # Invoke graph with memory
-        config = {"configurable": {"thread_id": self.thread_id}}
+        thread_id = thread_id or self.thread_id
+        config = {"configurable": {
+            "thread_id": thread_id, "llm_backend": backend, "user_question": user_question
+        }}
+        transcript = self._transcript(thread_id)
         
         result = self.graph.invoke(
             {
@@ -97,16 +154,133 @@ Instructions:
         
         # Extract AI response
         ai_response = result["messages"][-1].content
+        with self._transcript_lock:
+            transcript.append({"role": "user", "content": user_query})
+            transcript.append({"role": "assistant", "content": ai_response})
         return ai_response
     
-    def reset_memory(self):
+    def stream_response(self, user_query: str, image_context: str,
+                        thread_id: Optional[str] = None,
+                        backend: Optional[str] = None,
+                        user_question: Optional[str] = None) -> Iterator[str]:
+        """
+        Like generate_response, but yields the response text as it is generated
+        
+        The complete response is stored in memory once the stream finishes
+        """
+        thread_id = thread_id or self.thread_id
+        config = {"configurable": {
+            "thread_id": thread_id, "llm_backend": backend, "user_question": user_question
+        }}
+        transcript = self._transcript(thread_id)
+        # The graph stores the question even if the stream is abandoned
+        with self._transcript_lock:
+            transcript.append({"role": "user", "content": user_query})
+        
+        parts = []
+        for chunk, metadata in self.graph.stream(
+            {
+                "messages": [HumanMessage(content=user_query)],
+                "image_context": image_context
+            },
+            config=config,
+            stream_mode="messages"
+        ):
+            if chunk.content and metadata.get("langgraph_node") == "chatbot":
+                parts.append(chunk.content)
+                yield chunk.content
+        
+        with self._transcript_lock:
+            transcript.append({"role": "assistant", "content": "".join(parts)})
+    
+    @staticmethod
+    def new_thread_id() -> str:
+        """Create an id for a fresh conversation thread"""
+        return f"conversation_{uuid.uuid4().hex[:8]}"
+    
+    def reset_memory(self) -> str:
         """Clear conversation history by creating new thread"""
-        import uuid
-        self.thread_id = f"conversation_{uuid.uuid4().hex[:8]}"
+        self.thread_id = self.new_thread_id()
+        return self.thread_id
+    
+    def restore_history(self, thread_id: str, history: List[Dict], image_context: str):
+        """
+        Load a previously saved conversation into a thread's memory
+        
+        history uses the format returned by get_conversation_history
+        """
+        messages = [
+            HumanMessage(content=msg["content"]) if msg["role"] == "user"
+            else AIMessage(content=msg["content"])
+            for msg in history
+        ]
+        config = {"configurable": {"thread_id": thread_id}}
+        transcript = self._transcript(thread_id)
+        self.graph.update_state(
+            config,
+            {"messages": messages, "image_context": image_context},
+            as_node="chatbot"
+        )
+        with self._transcript_lock:
+            transcript.extend(
+                {"role": msg["role"], "content": msg["content"]} for msg in history
+            )
+    
+    def record_exchange(self, thread_id: str, user_query: str, response: str, image_context: str):
+        """Add a question answered without the LLM to a thread's memory"""
+        config = {"configurable": {"thread_id": thread_id}}
+        transcript = self._transcript(thread_id)
+        self.graph.update_state(
+            config,
+            {
+                "messages": [HumanMessage(content=user_query), AIMessage(content=response)],
+                "image_context": image_context
+            },
+            as_node="chatbot"
+        )
+        with self._transcript_lock:
+            transcript.append({"role": "user", "content": user_query})
+            transcript.append({"role": "assistant", "content": response})
+    
+    def _transcript(self, thread_id: str) -> List[Dict]:
+        """
+        A thread's transcript, rebuilt from the graph state the first time
+        
+        Callers fetch it before running the graph and append afterwards, so
+        the rebuilt copy never already contains the messages they add.
+        """
+        with self._transcript_lock:
+            transcript = self._transcripts.get(thread_id)
+            if transcript is None:
+                transcript = self._transcripts[thread_id] = self._history_from_state(thread_id)
+            return transcript
+    
+    def discard_history(self, thread_id: str):
+        """Drop a finished thread's transcript and its graph checkpoints"""
+        with self._transcript_lock:
+            self._transcripts.pop(thread_id, None)
+        self.memory.delete_thread(thread_id)
+    
+    def get_history_since(self, thread_id: Optional[str] = None,
+                          cursor: int = 0) -> Tuple[List[Dict], int]:
+        """
+        Messages appended to a thread after cursor, and the new cursor
+        
+        Start from cursor 0 and pass back the returned cursor to receive
+        only new messages on each call.
+        """
+        transcript = self._transcript(thread_id or self.thread_id)
+        with self._transcript_lock:
+            return transcript[cursor:], len(transcript)
+    
+    def get_conversation_history(self, thread_id: Optional[str] = None) -> list:
+        """Get conversation history for a thread (the current one by default)"""
+        messages, _ = self.get_history_since(thread_id)
+        return messages
     
-    def get_conversation_history(self) -> list:
-        """Get current conversation history"""
-        config = {"configurable": {"thread_id": self.thread_id}}
+    def _history_from_state(self, thread_id: str) -> List[Dict]:
+        """Rebuild a thread's transcript from the graph state"""
+        config = {"configurable": {"thread_id": thread_id}}
         
         try:
             # Get state from memory
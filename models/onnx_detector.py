@@ -0,0 +1,167 @@
+import ast
+import os
+import shutil
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+import torch
+from PIL import Image
+from torchvision.ops import batched_nms
+from ultralytics import YOLO
+from ultralytics.engine.results import Results
+from config import Config
+
+class ONNXYOLOModel:
+    """
+    YOLOv8 checkpoint exported to ONNX and run with ONNX Runtime on CPU
+
+    Exposes the subset of ultralytics' YOLO.predict used by YOLODetector and
+    returns ultralytics Results, so detections, plotting and positions are
+    built exactly as with the PyTorch backend.
+    """
+
+    MAX_DETECTIONS = 300
+
+    def __init__(self, weights: str, imgsz: int = Config.YOLO_IMGSZ):
+        """Export (once) and load the ONNX graph for the given weights"""
+        self.imgsz = imgsz
+        self.onnx_path = self._export(weights, imgsz)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = Config.ONNX_INTRA_OP_THREADS
+        options.inter_op_num_threads = Config.ONNX_INTER_OP_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            str(self.onnx_path),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+        # Ultralytics embeds the class names in the exported model's metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"])
+
+    @staticmethod
+    def _export(weights: str, imgsz: int) -> Path:
+        """Return the cached ONNX export, exporting on first use"""
+        export_dir = Path(Config.YOLO_EXPORT_DIR)
+        cached_path = export_dir / f"{Path(weights).stem}_{imgsz}_dynamic.onnx"
+        if cached_path.exists():
+            return cached_path
+
+        print(f"Exporting {weights} to ONNX (imgsz={imgsz})...")
+        export_dir.mkdir(parents=True, exist_ok=True)
+        # Dynamic axes so tiles and video keyframes run as one batch; inputs are
+        # still letterboxed to imgsz
+        exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True)
+
+        # Write under a temporary name so concurrent workers never load a partial file
+        tmp_path = cached_path.with_suffix(f".{os.getpid()}.tmp")
+        shutil.copyfile(exported, tmp_path)
+        os.replace(tmp_path, cached_path)
+        return cached_path
+
+    def predict(self, source: Union[str, Image.Image, np.ndarray, List], conf: float,
+                iou: float, verbose: bool = False, imgsz: int = None) -> List[Results]:
+        """
+        Run detection on an image path, PIL image, BGR array, or a list of those
+
+        imgsz is accepted for call compatibility; the graph's own input size is used.
+        """
+        sources = source if isinstance(source, list) else [source]
+        images = []
+        paths = []
+        for item in sources:
+            if isinstance(item, str):
+                images.append(cv2.imread(item))
+                paths.append(item)
+            elif isinstance(item, Image.Image):
+                # Same conversion ultralytics applies to PIL inputs
+                images.append(np.ascontiguousarray(np.asarray(item.convert('RGB'))[..., ::-1]))
+                paths.append("image0.jpg")
+            else:
+                images.append(item)
+                paths.append("image0.jpg")
+
+        batch = np.stack([self._letterbox(image) for image in images])
+        outputs = self.session.run(None, {self.input_name: batch})[0]
+
+        results = []
+        for image, path, prediction in zip(images, paths, outputs):
+            boxes = self._postprocess(prediction, image.shape[:2], conf, iou)
+            results.append(Results(image, path=path, names=self.names, boxes=boxes))
+        return results
+
+    def _letterbox(self, image: np.ndarray) -> np.ndarray:
+        """Resize and pad to the square input, matching ultralytics' LetterBox"""
+        height, width = image.shape[:2]
+        ratio = min(self.imgsz / height, self.imgsz / width)
+        new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+
+        pad_w = (self.imgsz - new_width) / 2
+        pad_h = (self.imgsz - new_height) / 2
+
+        if (width, height) != (new_width, new_height):
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+        top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+        left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+        image = cv2.copyMakeBorder(
+            image, top, bottom, left, right,
+            cv2.BORDER_CONSTANT, value=(114, 114, 114)
+        )
+
+        # BGR HWC uint8 -> RGB CHW float32 in [0, 1]
+        image = image[..., ::-1].transpose(2, 0, 1)
+        return np.ascontiguousarray(image, dtype=np.float32) / 255.0
+
+    def _postprocess(self, prediction: np.ndarray, orig_shape: Tuple[int, int],
+                     conf: float, iou: float) -> torch.Tensor:
+        """
+        Decode one (4 + classes, anchors) output into an (N, 6) tensor of
+        xyxy, confidence, class in original image coordinates
+        """
+        prediction = prediction.T
+        class_scores = prediction[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_scores)), class_ids]
+
+        keep = scores > conf
+        xywh = prediction[keep, :4]
+        scores = scores[keep]
+        class_ids = class_ids[keep]
+
+        boxes = np.empty_like(xywh)
+        boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+        boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+        boxes_t = torch.from_numpy(boxes)
+        scores_t = torch.from_numpy(scores)
+        classes_t = torch.from_numpy(class_ids)
+        kept = batched_nms(boxes_t, scores_t, classes_t, iou)[:self.MAX_DETECTIONS]
+
+        boxes_t = self._scale_boxes(boxes_t[kept], orig_shape)
+        return torch.cat([
+            boxes_t,
+            scores_t[kept, None],
+            classes_t[kept, None].float()
+        ], dim=1)
+
+    def _scale_boxes(self, boxes: torch.Tensor, orig_shape: Tuple[int, int]) -> torch.Tensor:
+        """Map boxes from letterboxed input space back to the original image"""
+        height, width = orig_shape
+        gain = min(self.imgsz / height, self.imgsz / width)
+        pad_x = round((self.imgsz - width * gain) / 2 - 0.1)
+        pad_y = round((self.imgsz - height * gain) / 2 - 0.1)
+
+        boxes[:, [0, 2]] -= pad_x
+        boxes[:, [1, 3]] -= pad_y
+        boxes /= gain
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clamp(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clamp(0, height)
+        return boxes
@@ -1,42 +1,286 @@
 from ultralytics import YOLO
 import cv2
 import numpy as np
-from typing import List, Dict, Tuple
+import torch
+from torchvision.ops import batched_nms
+from PIL import Image
+from typing import List, Dict, Tuple, Optional, Union
+import io
+import threading
+import time
 from config import Config
+from utils.weight_cache import load_yolo
+from utils.inference import configure_torch_threads
+from utils.analysis_record import position_description, structure_detections
 
 class YOLODetector:
     def __init__(self):
         """Initialize YOLOv8 detector"""
-        self.model = YOLO(Config.YOLO_MODEL)
+        configure_torch_threads()
         self.confidence = Config.YOLO_CONFIDENCE
         self.iou = Config.YOLO_IOU
+        self.default_tier = Config.YOLO_DEFAULT_TIER
         
-    def detect_objects(self, image_path: str) -> Dict:
+        # Tier models are loaded lazily; only the default tier is loaded up front.
+        # Each tier has its own load lock so loading one never blocks the others.
+        self._models = {}
+        self._model_locks = {tier: threading.Lock() for tier in Config.YOLO_MODEL_TIERS}
+        
+        # Running latency estimate per tier and number of detections in flight
+        self._latency_ms = dict(Config.YOLO_TIER_LATENCY_PRIORS_MS)
+        self._in_flight = 0
+        self._stats_lock = threading.Lock()
+        
+        self._get_model(self.default_tier)
+    
+    @property
+    def model(self) -> YOLO:
+        """Model for the default tier"""
+        return self._get_model(self.default_tier)
+    
+    def _get_model(self, tier: str) -> YOLO:
+        """Load a tier's model on first use, on the configured backend"""
+        model = self._models.get(tier)
+        if model is not None:
+            return model
+        
+        with self._model_locks[tier]:
+            if tier not in self._models:
+                weights = Config.YOLO_MODEL_TIERS[tier]
+                print(f"Loading YOLO tier '{tier}' ({weights}, {Config.YOLO_BACKEND})...")
+                if Config.YOLO_BACKEND == "onnx":
+                    # Imported lazily so the PyTorch backend doesn't need onnxruntime
+                    from models.onnx_detector import ONNXYOLOModel
+                    self._models[tier] = ONNXYOLOModel(weights, imgsz=Config.YOLO_IMGSZ)
+                elif Config.WEIGHT_CACHE_ENABLED:
+                    self._models[tier] = load_yolo(weights)
+                else:
+                    self._models[tier] = YOLO(weights)
+            return self._models[tier]
+    
+    def warmup(self):
         """
-        Detect objects in image with bounding boxes
+        Run synthetic passes on the default tier (and the cascade tier if enabled)
         
-        Returns:
-            Dict with detections, annotated_image, and structured info
+        The first pass absorbs lazy initialization and is discarded; the second
+        is timed, so the tier's latency estimate starts from a measured value.
         """
-        results = self.model.predict(
-            source=image_path,
-            conf=self.confidence,
+        tiers = {self.default_tier}
+        if Config.YOLO_CASCADE:
+            tiers.add(Config.YOLO_CASCADE_TIER)
+        
+        frame = np.full((Config.YOLO_IMGSZ, Config.YOLO_IMGSZ, 3), 114, dtype=np.uint8)
+        for tier in tiers:
+            self._get_model(tier).predict(
+                source=frame, conf=self.confidence, iou=self.iou,
+                imgsz=Config.YOLO_IMGSZ, verbose=False
+            )
+            self._predict(tier, frame, self.confidence)
+    
+    def select_tier(self, latency_budget_ms: Optional[float] = None) -> str:
+        """
+        Pick the most accurate tier expected to fit the latency budget
+        
+        Concurrent detections share the CPU, so the expected latency of each
+        tier is scaled by the number of detections already in flight.
+        """
+        budget = latency_budget_ms if latency_budget_ms is not None else Config.YOLO_LATENCY_BUDGET_MS
+        if budget is None:
+            return self.default_tier
+        
+        with self._stats_lock:
+            load = self._in_flight
+            estimates = dict(self._latency_ms)
+        
+        tiers = list(Config.YOLO_MODEL_TIERS)
+        chosen = tiers[0]
+        for tier in tiers:
+            if estimates.get(tier, float("inf")) * (1 + load) <= budget:
+                chosen = tier
+        return chosen
+    
+    def _predict(self, tier: str, source, conf: float):
+        """Run one prediction on a tier and fold its latency into the estimate"""
+        return self._predict_batch(tier, source, conf)[0]
+    
+    def _predict_batch(self, tier: str, source, conf: float) -> list:
+        """Run a prediction on one image or a list of images, returning all results"""
+        start = time.perf_counter()
+        results = self._get_model(tier).predict(
+            source=source,
+            conf=conf,
             iou=self.iou,
+            imgsz=Config.YOLO_IMGSZ,
             verbose=False
         )
+        # Per-image latency, so batches don't skew the tier estimate
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(results)
+        
+        with self._stats_lock:
+            previous = self._latency_ms.get(tier, elapsed_ms)
+            self._latency_ms[tier] = 0.8 * previous + 0.2 * elapsed_ms
+        
+        return results
+    
+    def detect_objects(self, image: Union[str, Image.Image],
+                       source: Optional[Union[str, bytes]] = None,
+                       tier: Optional[str] = None,
+                       latency_budget_ms: Optional[float] = None,
+                       cascade: Optional[bool] = None,
+                       annotate: bool = False) -> Dict:
+        """
+        Detect objects in image with bounding boxes
+        
+        Args:
+            image: Preprocessed image (path or PIL image) the detections are reported against
+            source: Optional full-resolution original (path or encoded bytes), used for tiled
+                detection of small objects when Config.YOLO_TILED_DETECTION is on
+            tier: Model tier to use; chosen from the latency budget and load if omitted
+            latency_budget_ms: Overrides Config.YOLO_LATENCY_BUDGET_MS for this request
+            cascade: Overrides Config.YOLO_CASCADE for this request
+            annotate: Also render an RGB annotated_image; callers that don't
+                display it should leave this off and use render_annotations later
+        
+        Returns:
+            Dict with detections, annotated_image (None unless annotate),
+            structured info, and the tier and latency used for this request
+        """
+        tier = tier or self.select_tier(latency_budget_ms)
+        cascade = Config.YOLO_CASCADE if cascade is None else cascade
+        
+        start = time.perf_counter()
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            result, tier, escalated = self._run_tiers(image, tier, cascade)
+            detection_results = self._process_result(result, tier, source, annotate)
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+        
+        detection_results['tier'] = tier
+        detection_results['escalated'] = escalated
+        detection_results['latency_ms'] = (time.perf_counter() - start) * 1000
+        return detection_results
+    
+    def detect_batch(self, images: List[np.ndarray], tier: Optional[str] = None) -> List[Dict]:
+        """
+        Detect objects in several BGR frames with one batched forward pass
+        
+        Returns one detection dict per frame (no tiling, cascade or annotation)
+        """
+        tier = tier or self.select_tier()
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            results = self._predict_batch(tier, list(images), self.confidence)
+            return [self._process_result(result, tier, None, False) for result in results]
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+    
+    def _run_tiers(self, image, tier: str, cascade: bool):
+        """
+        Run the chosen tier, or cascade from the small tier when enabled
+        
+        The small tier runs at the borderline threshold; if any confidence
+        falls between that and the normal threshold the request is escalated
+        to the chosen tier. A scene with nothing above the borderline
+        threshold is taken as empty.
+        """
+        small_tier = Config.YOLO_CASCADE_TIER
+        if not cascade or tier == small_tier:
+            return self._predict(tier, image, self.confidence), tier, False
+        
+        result = self._predict(small_tier, image, Config.YOLO_CASCADE_BORDERLINE)
+        scores = result.boxes.conf
+        if bool((scores < self.confidence).any()):
+            return self._predict(tier, image, self.confidence), tier, True
+        
+        return result, small_tier, False
+    
+    def _process_result(self, result, tier: str, source: Optional[Union[str, bytes]],
+                        annotate: bool) -> Dict:
+        """Build the detection dict from a first-pass result"""
+        img_height, img_width = result.orig_shape
+        
+        boxes = result.boxes.xyxy.cpu().numpy()
+        scores = result.boxes.conf.cpu().numpy()
+        class_ids = result.boxes.cls.cpu().numpy().astype(int)
+        
+        # Second, tiled pass over the full-resolution original
+        if source and self._should_tile(source, len(boxes)):
+            print("- Few objects found, running tiled detection...")
+            tile_boxes, tile_scores, tile_classes = self._detect_tiled(
+                tier, source, img_width, img_height
+            )
+            if len(tile_boxes):
+                boxes, scores, class_ids = self._merge_detections(
+                    np.concatenate([boxes, tile_boxes]),
+                    np.concatenate([scores, tile_scores]),
+                    np.concatenate([class_ids, tile_classes])
+                )
+        
+        detections = self._build_detections(
+            boxes, scores, class_ids, result.names, img_width, img_height
+        )
+        
+        # Draw onto the decoded frame YOLO already holds, converted to RGB in place
+        annotated_image = None
+        if annotate:
+            frame = result.orig_img
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+            annotated_image = self.render_annotations(frame, detections)
+        
+        # Generate structured description
+        structured_info = self._structure_detections(detections)
         
+        return {
+            'detections': detections,
+            'annotated_image': annotated_image,
+            'structured_info': structured_info,
+            'total_objects': len(detections),
+            'image_size': (img_width, img_height)
+        }
+    
+    def rescale_results(self, results: Dict, image_size: Tuple[int, int]) -> Dict:
+        """
+        Map stored results onto the same scene at a different resolution
+        
+        Positions are relative, so only boxes and centers change.
+        """
+        old_width, old_height = results['image_size']
+        scale_x = image_size[0] / old_width
+        scale_y = image_size[1] / old_height
+        
+        detections = []
+        for det in results['detections']:
+            x1, y1, x2, y2 = det['bbox']
+            center_x, center_y = det['center']
+            detections.append(dict(
+                det,
+                bbox=[x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y],
+                center=(center_x * scale_x, center_y * scale_y)
+            ))
+        
+        return dict(
+            results,
+            detections=detections,
+            annotated_image=None,
+            image_size=tuple(image_size)
+        )
+    
+    def _build_detections(self, boxes: np.ndarray, scores: np.ndarray,
+                          class_ids: np.ndarray, names: Dict[int, str],
+                          img_width: float, img_height: float) -> List[Dict]:
+        """Convert raw box arrays into detection dicts"""
         detections = []
-        result = results[0]
         
         # Extract detection information
-        for box in result.boxes:
-            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-            confidence = float(box.conf[0].cpu().numpy())
-            class_id = int(box.cls[0].cpu().numpy())
-            class_name = result.names[class_id]
+        for (x1, y1, x2, y2), confidence, class_id in zip(boxes, scores, class_ids):
+            class_name = names[int(class_id)]
             
             # Calculate position descriptors
-            img_height, img_width = result.orig_shape
             center_x = (x1 + x2) / 2
             center_y = (y1 + y2) / 2
             
@@ -46,73 +290,177 @@ class YOLODetector:
             
             detections.append({
                 'class': class_name,
-                'confidence': confidence,
+                'confidence': float(confidence),
                 'bbox': [float(x1), float(y1), float(x2), float(y2)],
                 'position': position,
                 'center': (float(center_x), float(center_y))
             })
         
-        # Get annotated image
-        annotated_image = result.plot()
+        return detections
+    
+    def _should_tile(self, source: Union[str, bytes], num_objects: int) -> bool:
+        """Only pay for tiling on large images where the first pass found little"""
+        if not Config.YOLO_TILED_DETECTION:
+            return False
+        if num_objects >= Config.YOLO_TILE_MAX_OBJECTS:
+            return False
         
-        # Generate structured description
-        structured_info = self._structure_detections(detections)
+        try:
+            # Reads the header only, no full decode
+            with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+                width, height = img.size
+        except Exception:
+            return False
         
-        return {
-            'detections': detections,
-            'annotated_image': annotated_image,
-            'structured_info': structured_info,
-            'total_objects': len(detections)
-        }
+        return max(width, height) >= Config.YOLO_TILE_MIN_IMAGE_SIZE
     
-    def _get_position_description(self, x: float, y: float, 
-                                  width: float, height: float) -> str:
-        """Generate natural language position description"""
-        # Divide image into 3x3 grid
-        col = "left" if x < width/3 else "center" if x < 2*width/3 else "right"
-        row = "top" if y < height/3 else "middle" if y < 2*height/3 else "bottom"
-        
-        if col == "center" and row == "middle":
-            return "center of the image"
-        elif col == "center":
-            return f"{row} center"
-        elif row == "middle":
-            return f"{col} side"
+    def _tile_origins(self, length: int, tile: int, step: int) -> List[int]:
+        """Start offsets along one axis so tiles cover the whole length"""
+        if length <= tile:
+            return [0]
+        origins = list(range(0, length - tile + 1, step))
+        if origins[-1] != length - tile:
+            origins.append(length - tile)
+        return origins
+    
+    def _detect_tiled(self, tier: str, source: Union[str, bytes], target_width: int,
+                      target_height: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Run YOLO over overlapping full-resolution tiles in one batch
+        
+        Returns boxes scaled to the target (preprocessed) image size
+        """
+        # Applies EXIF rotation, like preprocessing does
+        flags = cv2.IMREAD_COLOR
+        if isinstance(source, bytes):
+            full_image = cv2.imdecode(np.frombuffer(source, np.uint8), flags)
         else:
-            return f"{row} {col}"
+            full_image = cv2.imread(source, flags)
+        if full_image is None:
+            return np.empty((0, 4)), np.empty(0), np.empty(0, dtype=int)
+        
+        src_height, src_width = full_image.shape[:2]
+        tile = Config.YOLO_TILE_SIZE
+        step = max(1, int(tile * (1 - Config.YOLO_TILE_OVERLAP)))
+        
+        tiles = []
+        offsets = []
+        for y in self._tile_origins(src_height, tile, step):
+            for x in self._tile_origins(src_width, tile, step):
+                tiles.append(full_image[y:y + tile, x:x + tile])
+                offsets.append((x, y))
+        
+        results = self._get_model(tier).predict(
+            source=tiles,
+            conf=self.confidence,
+            iou=self.iou,
+            imgsz=tile,
+            verbose=False
+        )
+        
+        all_boxes, all_scores, all_classes = [], [], []
+        for (x, y), result in zip(offsets, results):
+            if len(result.boxes) == 0:
+                continue
+            all_boxes.append(result.boxes.xyxy.cpu().numpy() + [x, y, x, y])
+            all_scores.append(result.boxes.conf.cpu().numpy())
+            all_classes.append(result.boxes.cls.cpu().numpy().astype(int))
+        
+        if not all_boxes:
+            return np.empty((0, 4)), np.empty(0), np.empty(0, dtype=int)
+        
+        scale = [target_width / src_width, target_height / src_height] * 2
+        return (
+            np.concatenate(all_boxes) * scale,
+            np.concatenate(all_scores),
+            np.concatenate(all_classes)
+        )
     
-    def _structure_detections(self, detections: List[Dict]) -> str:
-        """Create structured text description of all detections"""
-        if not detections:
-            return "No objects detected in the image."
+    def _merge_detections(self, boxes: np.ndarray, scores: np.ndarray,
+                          class_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Class-aware NMS across first-pass and tile detections"""
+        keep = batched_nms(
+            torch.as_tensor(boxes, dtype=torch.float32),
+            torch.as_tensor(scores, dtype=torch.float32),
+            torch.as_tensor(class_ids, dtype=torch.int64),
+            self.iou
+        ).numpy()
+        return boxes[keep], scores[keep], class_ids[keep]
+    
+    # RGB colours cycled per class name
+    PALETTE = [
+        (255, 56, 56), (255, 157, 151), (255, 112, 31), (255, 178, 29),
+        (207, 210, 49), (72, 249, 10), (26, 147, 52), (0, 212, 187),
+        (44, 153, 168), (0, 194, 255), (52, 69, 147), (100, 115, 255),
+        (132, 56, 255), (203, 56, 255), (255, 149, 200), (255, 55, 199),
+    ]
+    
+    def render_annotations(self, image: Union[str, Image.Image, np.ndarray], detections: List[Dict],
+                           max_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """
+        Draw detection boxes and labels onto an RGB image
         
-        # Group by class
-        class_counts = {}
-        class_positions = {}
+        Args:
+            image: Path or PIL image that was detected, or an RGB array that is drawn on in place
+            detections: Detections from detect_objects, in that image's coordinates
+            max_size: Optional (width, height) bound for a downscaled preview
+        
+        Returns:
+            RGB array with annotations
+        """
+        if isinstance(image, (str, Image.Image)):
+            img = Image.open(image) if isinstance(image, str) else image
+            original_width, original_height = img.size
+            img = img.convert('RGB')  # Always a copy, the source stays untouched
+            if max_size:
+                img.thumbnail(max_size, Image.Resampling.BILINEAR)
+            frame = np.array(img)
+        else:
+            frame = image
+            original_height, original_width = frame.shape[:2]
+            if max_size:
+                scale = min(max_size[0] / original_width, max_size[1] / original_height)
+                if scale < 1:
+                    frame = cv2.resize(
+                        frame,
+                        (round(original_width * scale), round(original_height * scale)),
+                        interpolation=cv2.INTER_AREA
+                    )
+        
+        height, width = frame.shape[:2]
+        scale_x = width / original_width
+        scale_y = height / original_height
+        thickness = max(1, round((width + height) / 600))
+        font_scale = thickness / 3
         
         for det in detections:
-            class_name = det['class']
-            position = det['position']
+            x1, y1, x2, y2 = det['bbox']
+            x1, x2 = int(x1 * scale_x), int(x2 * scale_x)
+            y1, y2 = int(y1 * scale_y), int(y2 * scale_y)
+            color = self.PALETTE[sum(map(ord, det['class'])) % len(self.PALETTE)]
+            label = f"{det['class']} {det['confidence']:.2f}"
             
-            if class_name not in class_counts:
-                class_counts[class_name] = 0
-                class_positions[class_name] = []
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness, cv2.LINE_AA)
             
-            class_counts[class_name] += 1
-            class_positions[class_name].append(position)
-        
-        # Build description
-        description_parts = []
-        for class_name, count in class_counts.items():
-            positions = class_positions[class_name]
-            if count == 1:
-                description_parts.append(
-                    f"1 {class_name} at {positions[0]}"
-                )
-            else:
-                pos_str = ", ".join(positions[:-1]) + f" and {positions[-1]}"
-                description_parts.append(
-                    f"{count} {class_name}s at {pos_str}"
-                )
+            # Filled label background above the box (inside it at the top edge)
+            (text_w, text_h), baseline = cv2.getTextSize(
+                label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, max(1, thickness - 1)
+            )
+            outside = y1 - text_h - baseline >= 0
+            label_y2 = y1 if outside else y1 + text_h + baseline
+            label_y1 = label_y2 - text_h - baseline
+            cv2.rectangle(frame, (x1, label_y1), (x1 + text_w, label_y2), color, -1, cv2.LINE_AA)
+            cv2.putText(frame, label, (x1, label_y2 - baseline),
+                        cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255),
+                        max(1, thickness - 1), cv2.LINE_AA)
         
-        return "Detected: " + "; ".join(description_parts) + "."
\ No newline at end of file
+        return frame
+    
+    def _get_position_description(self, x: float, y: float, 
+                                  width: float, height: float) -> str:
+        """Generate natural language position description"""
+        return position_description(x, y, width, height)
+    
+    def _structure_detections(self, detections: List[Dict]) -> str:
+        """Create structured text description of all detections"""
+        return structure_detections(detections)
\ No newline at end of file
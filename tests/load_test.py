@@ -0,0 +1,455 @@
+"""
+Load test: simulate concurrent users against the chatbot
+
+Each simulated user uploads its own image and then asks a few questions.
+By default everything runs in-process through the same PipelineScheduler
+the UI uses (or a WorkerPool of model processes with --workers), with a
+fake LLM of configurable latency and fake vision models, so it measures
+the serving stack rather than the models; pass --real-yolo (nano tier)
+and/or --real-blip to include real inference.
+With --url the same workload is sent to a running JSON API instead
+(api.py, or app.py with API_ENABLED), and with --gradio-url to the
+Gradio UI's process_image and chat handlers (needs gradio_client).
+
+Reports throughput, per-stage latency percentiles, errors by type,
+session mix-ups and memory growth over the run.
+
+Usage:
+    python load_test.py --users 20 --questions 3 --llm-latency 0.5
+    python load_test.py --users 20 --workers 4
+    python load_test.py --users 50 --url http://127.0.0.1:8000
+    python load_test.py --users 20 --gradio-url http://127.0.0.1:7860
+"""
+import sys
+sys.path.append('..')
+
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import argparse
+import functools
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+import uuid
+
+import numpy as np
+from PIL import Image
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from config import Config
+from models.yolo_detector import YOLODetector
+from utils.result_store import ResultStore
+
+QUESTIONS = [
+    "What objects do you see?",
+    "Where is the main object?",
+    "How many items are there?",
+    "What color is the largest object?",
+    "What is the person doing?",
+    "Is there anything on the left side?",
+]
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that sleeps for a fixed latency and echoes the question"""
+
+    latency_s: float = 0.5
+    tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-load-test"
+
+    def _reply(self, messages) -> str:
+        return f"Answer to '{messages[-1].content[:60]}': " + " ".join(["word"] * self.tokens)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency_s)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._reply(messages).split(" ")
+        for word in words:
+            time.sleep(self.latency_s / len(words))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+class FakeYOLODetector(YOLODetector):
+    """Detector returning random boxes after a fixed latency; no weights are loaded"""
+
+    CLASSES = {0: "person", 1: "dog", 2: "car", 3: "chair", 4: "cup"}
+
+    def __init__(self, latency_s: float = 0.1):
+        self.latency_s = latency_s
+        self.confidence = Config.YOLO_CONFIDENCE
+        self.default_tier = "fake"
+
+    def _fake_result(self, image) -> Dict:
+        if isinstance(image, str):
+            with Image.open(image) as img:
+                width, height = img.size
+        elif isinstance(image, np.ndarray):
+            height, width = image.shape[:2]
+        else:
+            width, height = image.size
+
+        count = random.randint(0, 6)
+        x1 = np.random.uniform(0, width * 0.8, count)
+        y1 = np.random.uniform(0, height * 0.8, count)
+        boxes = np.stack([x1, y1, x1 + width * 0.15, y1 + height * 0.15], axis=1) if count else np.zeros((0, 4))
+        detections = self._build_detections(
+            boxes, np.random.uniform(0.5, 1.0, count),
+            np.random.randint(0, len(self.CLASSES), count), self.CLASSES, width, height
+        )
+        return {
+            'detections': detections,
+            'annotated_image': None,
+            'structured_info': self._structure_detections(detections),
+            'total_objects': len(detections),
+            'image_size': (width, height),
+            'tier': self.default_tier,
+            'escalated': False,
+            'latency_ms': self.latency_s * 1000,
+        }
+
+    def warmup(self):
+        pass
+
+    def detect_objects(self, image, source=None, **kwargs) -> Dict:
+        time.sleep(self.latency_s)
+        return self._fake_result(image)
+
+    def detect_batch(self, images, tier=None) -> List[Dict]:
+        time.sleep(self.latency_s * len(images))
+        return [self._fake_result(image) for image in images]
+
+class FakeBLIPCaptioner:
+    """Captioner with fixed latencies; captions name the image size so mix-ups are visible"""
+
+    def __init__(self, caption_latency_s: float = 0.3, vqa_latency_s: float = 0.2):
+        self.caption_latency_s = caption_latency_s
+        self.vqa_latency_s = vqa_latency_s
+
+    @staticmethod
+    def _size(image):
+        if isinstance(image, str):
+            with Image.open(image) as img:
+                return img.size
+        return image.size
+
+    def generate_caption(self, image) -> str:
+        time.sleep(self.caption_latency_s)
+        return f"a test scene of size {self._size(image)}"
+
+    def answer_question(self, image, question: str, cancel_event=None) -> str:
+        time.sleep(self.vqa_latency_s)
+        return "blue and white"
+
+def make_image(seed: int) -> bytes:
+    """A distinct random JPEG per user, so no two users share an analysis"""
+    rng = np.random.default_rng(seed)
+    width, height = int(rng.integers(480, 1280)), int(rng.integers(360, 960))
+    pixels = rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels).resize((width, height), Image.Resampling.NEAREST)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+def rss_mb() -> float:
+    """Resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class LoadStats:
+    """Thread-safe latency, error and memory records"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.memory = []
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.latencies[stage].append(seconds * 1000)
+
+    def error(self, stage: str, kind: str):
+        with self._lock:
+            self.errors[(stage, kind)] += 1
+
+    def sample_memory(self, started: float):
+        current, _ = tracemalloc.get_traced_memory()
+        with self._lock:
+            self.memory.append((time.monotonic() - started, rss_mb(), current / 2**20))
+
+def build_chatbot(real_yolo: bool, real_blip: bool, yolo_latency: float,
+                  blip_latency: float, llm_latency: float):
+    """The chatbot under test; module-level so worker processes can build it too"""
+    from main import ConversationalImageChatbot
+    from models.llm_conversational import ConversationalLLM
+
+    if real_yolo:
+        Config.YOLO_DEFAULT_TIER = "n"
+    return ConversationalImageChatbot(
+        yolo=None if real_yolo else FakeYOLODetector(yolo_latency),
+        blip=None if real_blip else FakeBLIPCaptioner(blip_latency, blip_latency),
+        llm=ConversationalLLM(llm=FakeChatModel(latency_s=llm_latency))
+    )
+
+def chatbot_factory(args):
+    return functools.partial(
+        build_chatbot, args.real_yolo, args.real_blip,
+        args.yolo_latency, args.blip_latency, args.llm_latency
+    )
+
+class InProcessClient:
+    """Drives ConversationalImageChatbot through a PipelineScheduler"""
+
+    def __init__(self, args):
+        from utils.scheduler import PipelineScheduler
+
+        self.chatbot = chatbot_factory(args)()
+        self.scheduler = PipelineScheduler(self.chatbot)
+        self.stream = args.stream
+
+    def upload(self, session_id: str, image: bytes) -> Optional[str]:
+        self.scheduler.submit_analysis(image, session_id).result()
+        # Catch one user's analysis landing in another user's session
+        if self.chatbot.get_session(session_id).image_key != ResultStore.image_key(image):
+            return "session_mismatch"
+        return None
+
+    def ask(self, session_id: str, question: str):
+        if self.stream:
+            chunks = []
+            self.scheduler.submit_chat(
+                question, session_id,
+                fn=lambda: chunks.extend(self.chatbot.chat_stream(question, session_id))
+            ).result()
+        else:
+            self.scheduler.submit_chat(question, session_id).result()
+
+    def stats(self) -> Dict:
+        return self.scheduler.stats()
+
+class PoolClient(InProcessClient):
+    """Drives a WorkerPool of model processes, as app.py does with --workers"""
+
+    def __init__(self, args):
+        from utils.worker_pool import WorkerPool
+
+        self.scheduler = WorkerPool(args.workers, chatbot_factory=chatbot_factory(args))
+        self.chatbot = self.scheduler.chatbot
+        self.stream = args.stream
+
+    def upload(self, session_id: str, image: bytes) -> Optional[str]:
+        self.scheduler.submit_analysis(image, session_id).result()
+        if self.chatbot.session_info(session_id)['image_key'] != ResultStore.image_key(image):
+            return "session_mismatch"
+        return None
+
+class HTTPClient:
+    """Sends the same workload to a running JSON API"""
+
+    def __init__(self, args):
+        self.url = args.url.rstrip("/")
+
+    def _post(self, path: str, data: bytes, content_type: str, user_id: str) -> Dict:
+        request = urllib.request.Request(
+            self.url + path, data=data, method="POST",
+            headers={"Content-Type": content_type, "X-User-Id": user_id}
+        )
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return json.loads(response.read())
+
+    def upload(self, session_id: str, image: bytes) -> Optional[str]:
+        self._post(f"/v1/sessions/{session_id}/image", image, "application/octet-stream", session_id)
+        return None
+
+    def ask(self, session_id: str, question: str):
+        body = json.dumps({"question": question}).encode()
+        self._post(f"/v1/sessions/{session_id}/questions", body, "application/json", session_id)
+
+    def stats(self) -> Dict:
+        with urllib.request.urlopen(self.url + "/v1/stats", timeout=30) as response:
+            return json.loads(response.read())
+
+class GradioClient:
+    """
+    Sends the workload through the Gradio UI's event handlers
+
+    Gradio keys sessions by connection, so each simulated user gets its own
+    gradio_client.Client and with it its own session_hash.
+    """
+
+    def __init__(self, args):
+        try:
+            from gradio_client import Client, handle_file
+        except ImportError:
+            raise ImportError("--gradio-url needs: pip install gradio_client")
+        self._client_class = Client
+        self._handle_file = handle_file
+        self.url = args.gradio_url
+        self._users: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _user(self, session_id: str) -> Dict:
+        with self._lock:
+            if session_id not in self._users:
+                self._users[session_id] = {
+                    'client': self._client_class(self.url, verbose=False), 'history': []
+                }
+            return self._users[session_id]
+
+    def upload(self, session_id: str, image: bytes) -> Optional[str]:
+        user = self._user(session_id)
+        # The image input takes a file; gradio_client uploads it
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as f:
+            f.write(image)
+            f.flush()
+            user['client'].predict(self._handle_file(f.name), api_name="/process_image")
+        user['history'] = []
+        return None
+
+    def ask(self, session_id: str, question: str):
+        user = self._user(session_id)
+        history, *_ = user['client'].predict(question, user['history'], api_name="/chat")
+        user['history'] = history
+
+    def stats(self) -> Dict:
+        return {"note": "queue statistics are not exposed by the Gradio UI"}
+
+def simulate_user(client, user: int, args, stats: LoadStats):
+    """One session: upload an image, then ask questions with think time between them"""
+    session_id = f"load-{user}-{uuid.uuid4().hex[:6]}"
+    image = make_image(args.seed + user)
+
+    stages = [("upload", None)] + [("question", q) for q in random.sample(QUESTIONS, args.questions)]
+    for stage, question in stages:
+        started = time.monotonic()
+        try:
+            if stage == "upload":
+                problem = client.upload(session_id, image)
+                if problem:
+                    stats.error(stage, problem)
+            else:
+                client.ask(session_id, question)
+            stats.record(stage, time.monotonic() - started)
+        except Exception as e:
+            stats.error(stage, type(e).__name__)
+            if stage == "upload":
+                return
+        time.sleep(random.uniform(0, args.think_time))
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "no samples"
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(p * len(values)))]
+    return (f"n={len(values):4d}  p50={pick(0.50):8.0f}  p95={pick(0.95):8.0f}  "
+            f"p99={pick(0.99):8.0f}  max={values[-1]:8.0f} ms")
+
+def run_load_test(args) -> bool:
+    print("="*60)
+    print(f"LOAD TEST: {args.users} users x (1 upload + {args.questions} questions)")
+    print("="*60)
+
+    random.seed(args.seed)
+    tracemalloc.start()
+    if args.url:
+        client = HTTPClient(args)
+    elif args.gradio_url:
+        client = GradioClient(args)
+    elif args.workers:
+        client = PoolClient(args)
+    else:
+        client = InProcessClient(args)
+
+    stats = LoadStats()
+    started = time.monotonic()
+    stats.sample_memory(started)
+
+    stop = threading.Event()
+    def monitor():
+        while not stop.wait(args.memory_interval):
+            stats.sample_memory(started)
+    threading.Thread(target=monitor, daemon=True).start()
+
+    # Users arrive over the ramp-up period rather than all at once
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        for user in range(args.users):
+            pool.submit(simulate_user, client, user, args, stats)
+            time.sleep(args.ramp_up / max(1, args.users))
+
+    elapsed = time.monotonic() - started
+    stop.set()
+    stats.sample_memory(started)
+
+    completed = sum(len(values) for values in stats.latencies.values())
+    failed = sum(stats.errors.values())
+    print(f"\nDuration: {elapsed:.1f}s")
+    print(f"Throughput: {completed / elapsed:.2f} requests/s "
+          f"({len(stats.latencies['upload']) / elapsed:.2f} uploads/s)")
+
+    print("\nLatency by stage:")
+    for stage in ("upload", "question"):
+        print(f"  {stage:9s} {percentiles(stats.latencies[stage])}")
+
+    print(f"\nErrors: {failed} of {completed + failed} requests")
+    for (stage, kind), count in sorted(stats.errors.items()):
+        print(f"  {stage:9s} {kind}: {count}")
+
+    print("\nMemory (elapsed s, RSS MB, Python heap MB):")
+    step = max(1, len(stats.memory) // 10)
+    for elapsed_s, rss, heap in stats.memory[::step] + stats.memory[-1:]:
+        print(f"  {elapsed_s:7.1f}  {rss:9.1f}  {heap:9.1f}")
+    growth = stats.memory[-1][1] - stats.memory[0][1]
+    print(f"  RSS growth: {growth:+.1f} MB ({growth / max(1, args.users):+.2f} MB per session)")
+
+    print("\nScheduler:")
+    print(json.dumps(client.stats(), indent=2))
+
+    passed = stats.errors.get(("upload", "session_mismatch"), 0) == 0
+    print("\n" + "="*60)
+    print("✅ LOAD TEST COMPLETED" if passed else "❌ SESSIONS WERE MIXED UP")
+    print("="*60)
+    return passed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument("--questions", type=int, default=3, help="Questions per user after the upload")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="Seconds over which users arrive")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Max seconds between a user's requests")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Fake LLM response time (s)")
+    parser.add_argument("--yolo-latency", type=float, default=0.1, help="Fake detector latency (s)")
+    parser.add_argument("--blip-latency", type=float, default=0.3, help="Fake captioner/VQA latency (s)")
+    parser.add_argument("--real-yolo", action="store_true", help="Use the real detector's nano tier")
+    parser.add_argument("--real-blip", action="store_true", help="Use the real BLIP-2 model")
+    parser.add_argument("--stream", action="store_true", help="Ask questions through chat_stream")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Run the models in this many worker processes (WorkerPool)")
+    parser.add_argument("--url", help="Base URL of a running JSON API instead of in-process")
+    parser.add_argument("--gradio-url", help="Base URL of a running Gradio UI (app.py) instead of in-process")
+    parser.add_argument("--memory-interval", type=float, default=1.0, help="Seconds between memory samples")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    args.questions = min(args.questions, len(QUESTIONS))
+    return args
+
+if __name__ == "__main__":
+    run_load_test(parse_args())
@@ -5,6 +5,8 @@ import sys
 sys.path.append('..')
 
 from test_yolo import test_yolo
+from test_onnx_backend import test_onnx_backend
+from test_analysis_record import test_analysis_record
 from test_blip import test_blip
 from test_llm import test_llm
 from test_integration import test_integration
@@ -17,22 +19,32 @@ def run_all_tests():
     results = {}
     
     # Test 1: YOLO
-    print("\n[1/4] Testing YOLO...")
+    print("\n[1/6] Testing YOLO...")
     results['YOLO'] = test_yolo()
+    input("\nPress Enter to continue to ONNX backend test...")
+    
+    # Test 2: ONNX backend parity
+    print("\n[2/6] Testing ONNX backend...")
+    results['ONNX Backend'] = test_onnx_backend()
+    input("\nPress Enter to continue to analysis record test...")
+    
+    # Test 3: Analysis record
+    print("\n[3/6] Testing analysis record...")
+    results['Analysis Record'] = test_analysis_record()
     input("\nPress Enter to continue to BLIP test...")
     
-    # Test 2: BLIP
-    print("\n[2/4] Testing BLIP-2...")
+    # Test 4: BLIP
+    print("\n[4/6] Testing BLIP-2...")
     results['BLIP'] = test_blip()
     input("\nPress Enter to continue to LLM test...")
     
-    # Test 3: LLM
-    print("\n[3/4] Testing LLM...")
+    # Test 5: LLM
+    print("\n[5/6] Testing LLM...")
     results['LLM'] = test_llm()
     input("\nPress Enter to continue to Integration test...")
     
-    # Test 4: Integration
-    print("\n[4/4] Testing Integration...")
+    # Test 6: Integration
+    print("\n[6/6] Testing Integration...")
     results['Integration'] = test_integration()
     
     # Summary
@@ -0,0 +1,98 @@
+"""
+Test the compact analysis record: round trips and memory footprint
+
+Builds detector-style results for synthetic scenes and compares the
+resident size of the old per-image dicts (results, caption and context
+string) with an AnalysisRecord and its serialized form.
+"""
+import sys
+sys.path.append('..')
+
+from utils.analysis_record import AnalysisRecord, deep_sizeof, position_description, structure_detections
+from utils.prompt_builder import PromptBuilder
+import random
+import time
+
+CLASSES = ["person", "car", "dog", "chair", "cup", "bottle", "laptop", "potted plant"]
+
+def make_yolo_results(num_objects: int, size=(1280, 960), seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    width, height = size
+    detections = []
+    for _ in range(num_objects):
+        x1, y1 = rng.uniform(0, width - 50), rng.uniform(0, height - 50)
+        x2, y2 = rng.uniform(x1 + 10, width), rng.uniform(y1 + 10, height)
+        center = ((x1 + x2) / 2, (y1 + y2) / 2)
+        detections.append({
+            'class': rng.choice(CLASSES),
+            'confidence': rng.uniform(0.25, 0.99),
+            'bbox': [x1, y1, x2, y2],
+            'position': position_description(center[0], center[1], width, height),
+            'center': center,
+        })
+    return {
+        'detections': detections,
+        'annotated_image': None,
+        'structured_info': structure_detections(detections),
+        'total_objects': len(detections),
+        'image_size': size,
+    }
+
+def test_analysis_record():
+    print("="*60)
+    print("TESTING ANALYSIS RECORD")
+    print("="*60)
+
+    try:
+        caption = "a group of people sitting around a table with laptops and cups"
+
+        print("\n1. Round trip...")
+        results = make_yolo_results(12)
+        record = AnalysisRecord.from_yolo_results(results, caption, image_key="abc123")
+        restored = AnalysisRecord.from_bytes(record.to_bytes())
+        assert restored.detections == record.detections
+        assert restored.image_context == record.image_context
+        assert restored.image_key == "abc123" and restored.image_size == record.image_size
+        expected = [(det['class'], det['position']) for det in results['detections']]
+        assert [(det['class'], det['position']) for det in record.detections] == expected
+        print("   ✓ Detections and context survive serialization")
+
+        print("\n2. Rescaling...")
+        half = record.rescaled((640, 480))
+        assert [det['position'] for det in half.detections] == [det['position'] for det in record.detections]
+        print("   ✓ Positions unchanged at half resolution")
+
+        print("\n3. Memory footprint per image (bytes)...")
+        print(f"   {'objects':>8s} {'dicts':>10s} {'record':>10s} {'bytes':>10s}")
+        for num_objects in (0, 5, 20, 100):
+            results = make_yolo_results(num_objects, seed=num_objects)
+            legacy = {
+                'yolo_results': results,
+                'blip_caption': caption,
+                'image_context': PromptBuilder.build_image_context(results, caption),
+            }
+            record = AnalysisRecord.from_yolo_results(results, caption)
+            serialized = record.to_bytes()
+            print(f"   {num_objects:8d} {deep_sizeof(legacy):10d} {record.nbytes():10d} "
+                  f"{sys.getsizeof(serialized):10d}")
+            if num_objects:
+                assert record.nbytes() < deep_sizeof(legacy)
+
+        print("\n4. Cost of deriving the context on demand...")
+        record = AnalysisRecord.from_yolo_results(make_yolo_results(20), caption)
+        start = time.perf_counter()
+        for _ in range(1000):
+            record.image_context
+        print(f"   {(time.perf_counter() - start):.2f} ms per context (20 objects)")
+
+        print("\n✅ Analysis record test passed!")
+        return True
+
+    except Exception as e:
+        print(f"\n❌ Analysis record test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == "__main__":
+    test_analysis_record()
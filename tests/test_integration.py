@@ -51,7 +51,7 @@ def test_integration():
         annotated = chatbot.get_detection_visualization()
         if annotated is not None:
             import cv2
-            cv2.imwrite("test_integration_output.jpg", annotated)
+            cv2.imwrite("test_integration_output.jpg", cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR))
             print(f"   ✓ Annotated image saved to: test_integration_output.jpg")
         else:
             print("   ⚠ No visualization generated")
@@ -0,0 +1,82 @@
+"""
+Test ONNX Runtime YOLO backend parity against the PyTorch backend
+"""
+import sys
+sys.path.append('..')
+
+from config import Config
+from models.yolo_detector import YOLODetector
+import cv2
+import time
+
+def test_onnx_backend():
+    print("="*60)
+    print("TESTING ONNX BACKEND PARITY")
+    print("="*60)
+
+    original_backend = Config.YOLO_BACKEND
+
+    try:
+        image_path = "sample_image.jpg"  # Replace with your test image
+
+        # Reference detections from PyTorch
+        print("\n1. Running PyTorch backend...")
+        Config.YOLO_BACKEND = "torch"
+        torch_yolo = YOLODetector()
+        start = time.time()
+        torch_results = torch_yolo.detect_objects(image_path)
+        print(f"   ✓ {torch_results['total_objects']} objects in {time.time()-start:.2f}s")
+
+        # Same image through the exported ONNX graph
+        print("\n2. Running ONNX Runtime backend...")
+        Config.YOLO_BACKEND = "onnx"
+        onnx_yolo = YOLODetector()
+        start = time.time()
+        onnx_results = onnx_yolo.detect_objects(image_path)
+        print(f"   ✓ {onnx_results['total_objects']} objects in {time.time()-start:.2f}s")
+
+        # Compare results
+        print("\n3. Comparing results...")
+        assert onnx_results['total_objects'] == torch_results['total_objects'], \
+            "Object counts differ"
+        assert onnx_results['structured_info'] == torch_results['structured_info'], \
+            "Structured info differs"
+
+        for torch_det, onnx_det in zip(torch_results['detections'], onnx_results['detections']):
+            assert torch_det['class'] == onnx_det['class'], "Class differs"
+            assert torch_det['position'] == onnx_det['position'], "Position differs"
+            assert abs(torch_det['confidence'] - onnx_det['confidence']) < 0.01, \
+                f"Confidence differs for {torch_det['class']}"
+            for a, b in zip(torch_det['bbox'], onnx_det['bbox']):
+                assert abs(a - b) < 1.0, f"Bounding box differs for {torch_det['class']}"
+            print(f"   ✓ {onnx_det['class']} - {onnx_det['position']} "
+                  f"(conf: {onnx_det['confidence']:.2f} vs {torch_det['confidence']:.2f})")
+
+        # Several images in one call, as tiling and video keyframes do
+        print("\n4. Running a batch...")
+        frame = cv2.imread(image_path)
+        batch_results = onnx_yolo.detect_batch([frame, frame])
+        assert len(batch_results) == 2, "Expected one result per image"
+        assert batch_results[0]['structured_info'] == batch_results[1]['structured_info'], \
+            "Identical images in a batch gave different detections"
+        print(f"   ✓ {len(batch_results)} images in one batch")
+
+        print("\n" + "="*60)
+        print("✅ ONNX BACKEND TEST PASSED")
+        print("="*60)
+        return True
+
+    except Exception as e:
+        print("\n" + "="*60)
+        print("❌ ONNX BACKEND TEST FAILED")
+        print("="*60)
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    finally:
+        Config.YOLO_BACKEND = original_backend
+
+if __name__ == "__main__":
+    test_onnx_backend()
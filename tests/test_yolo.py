@@ -42,7 +42,8 @@ def test_yolo():
         
         # Save annotated image
         output_path = "test_yolo_output.jpg"
-        cv2.imwrite(output_path, results['annotated_image'])
+        annotated = yolo.render_annotations(image_path, results['detections'])
+        cv2.imwrite(output_path, cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR))
         print(f"\n4. Annotated image saved to: {output_path}")
         
         print("\n" + "="*60)
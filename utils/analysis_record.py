@@ -0,0 +1,220 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import json
+import struct
+import sys
+import numpy as np
+from utils.prompt_builder import PromptBuilder
+
+_MAGIC = b"AR1\0"
+
+def position_description(x: float, y: float, width: float, height: float) -> str:
+    """Natural language position of a point in a 3x3 grid over the image"""
+    col = "left" if x < width/3 else "center" if x < 2*width/3 else "right"
+    row = "top" if y < height/3 else "middle" if y < 2*height/3 else "bottom"
+
+    if col == "center" and row == "middle":
+        return "center of the image"
+    elif col == "center":
+        return f"{row} center"
+    elif row == "middle":
+        return f"{col} side"
+    else:
+        return f"{row} {col}"
+
+def structure_detections(detections: List[Dict]) -> str:
+    """Structured text description of all detections, grouped by class"""
+    if not detections:
+        return "No objects detected in the image."
+
+    class_positions: Dict[str, List[str]] = {}
+    for det in detections:
+        class_positions.setdefault(det['class'], []).append(det['position'])
+
+    description_parts = []
+    for class_name, positions in class_positions.items():
+        if len(positions) == 1:
+            description_parts.append(f"1 {class_name} at {positions[0]}")
+        else:
+            pos_str = ", ".join(positions[:-1]) + f" and {positions[-1]}"
+            description_parts.append(f"{len(positions)} {class_name}s at {pos_str}")
+
+    return "Detected: " + "; ".join(description_parts) + "."
+
+def deep_sizeof(obj, _seen: Optional[set] = None) -> int:
+    """
+    Bytes held by obj and everything it references, counted once each
+
+    Numpy arrays count their data buffer. Shared objects such as interned
+    class names are counted wherever they are first reached, so per-object
+    figures are an upper bound.
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, np.ndarray):
+        return size + (deep_sizeof(obj.base, seen) if obj.base is not None else 0)
+    if isinstance(obj, dict):
+        return size + sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(deep_sizeof(item, seen) for item in obj)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+@dataclass(slots=True, eq=False)
+class AnalysisRecord:
+    """
+    Compact analysis of one image: detection arrays plus the BLIP caption
+
+    Boxes, scores and class ids are three small numpy arrays instead of a
+    list of per-detection dicts. The detection dicts, the structured summary
+    and the LLM image context are derived from them when asked for, not
+    kept. Records serialize to bytes for the result store and the in-memory
+    near-duplicate cache.
+    """
+
+    image_size: Tuple[int, int]
+    boxes: np.ndarray  # (N, 4) float32 x1, y1, x2, y2 in image_size pixels
+    scores: np.ndarray  # (N,) float32 confidences
+    class_ids: np.ndarray  # (N,) uint16 indexes into labels
+    labels: Tuple[str, ...]  # Names of the classes present
+    caption: str
+    image_key: Optional[str] = None
+
+    @classmethod
+    def from_yolo_results(cls, yolo_results: Dict, caption: str,
+                          image_key: Optional[str] = None) -> "AnalysisRecord":
+        """Pack a detector result dict (detect_objects / rescale_results) and caption"""
+        detections = yolo_results['detections']
+        labels = tuple(dict.fromkeys(sys.intern(det['class']) for det in detections))
+        label_ids = {label: i for i, label in enumerate(labels)}
+        width, height = yolo_results['image_size']
+        return cls(
+            image_size=(int(width), int(height)),
+            boxes=np.array([det['bbox'] for det in detections], dtype=np.float32).reshape(-1, 4),
+            scores=np.array([det['confidence'] for det in detections], dtype=np.float32),
+            class_ids=np.array([label_ids[det['class']] for det in detections], dtype=np.uint16),
+            labels=labels,
+            caption=caption,
+            image_key=image_key,
+        )
+
+    @property
+    def total_objects(self) -> int:
+        return len(self.scores)
+
+    @property
+    def detections(self) -> List[Dict]:
+        """Per-detection dicts in the detector's format, built on each call"""
+        width, height = self.image_size
+        detections = []
+        for (x1, y1, x2, y2), score, class_id in zip(
+            self.boxes.tolist(), self.scores.tolist(), self.class_ids.tolist()
+        ):
+            center_x, center_y = (x1 + x2) / 2, (y1 + y2) / 2
+            detections.append({
+                'class': self.labels[class_id],
+                'confidence': round(score, 4),
+                'bbox': [round(x1, 2), round(y1, 2), round(x2, 2), round(y2, 2)],
+                'position': position_description(center_x, center_y, width, height),
+                'center': (center_x, center_y),
+            })
+        return detections
+
+    @property
+    def yolo_results(self) -> Dict:
+        """The detector's result dict, as the prompt builder and detection index expect"""
+        detections = self.detections
+        return {
+            'detections': detections,
+            'annotated_image': None,
+            'structured_info': structure_detections(detections),
+            'total_objects': len(detections),
+            'image_size': self.image_size,
+        }
+
+    @property
+    def image_context(self) -> str:
+        """LLM context for the image, derived from the record on each call"""
+        return PromptBuilder.build_image_context(self.yolo_results, self.caption)
+
+    def rescaled(self, image_size: Tuple[int, int], image_key: Optional[str] = None) -> "AnalysisRecord":
+        """
+        The same scene at a different resolution
+
+        Positions are relative, so only the boxes change.
+        """
+        scale = np.array([
+            image_size[0] / self.image_size[0], image_size[1] / self.image_size[1]
+        ] * 2, dtype=np.float32)
+        return AnalysisRecord(
+            image_size=(int(image_size[0]), int(image_size[1])),
+            boxes=self.boxes * scale,
+            scores=self.scores,
+            class_ids=self.class_ids,
+            labels=self.labels,
+            caption=self.caption,
+            image_key=image_key or self.image_key,
+        )
+
+    def nbytes(self) -> int:
+        """Measured resident size of the record, arrays and strings included"""
+        return deep_sizeof(self)
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize as a JSON header followed by the raw little-endian arrays
+
+        Layout: magic, header length (uint32), header, boxes (float32),
+        scores (float32), class ids (uint16).
+        """
+        header = json.dumps({
+            'image_size': self.image_size,
+            'labels': self.labels,
+            'caption': self.caption,
+            'image_key': self.image_key,
+            'count': self.total_objects,
+        }, separators=(",", ":")).encode()
+        return b"".join([
+            _MAGIC,
+            struct.pack("<I", len(header)),
+            header,
+            self.boxes.astype("<f4", copy=False).tobytes(),
+            self.scores.astype("<f4", copy=False).tobytes(),
+            self.class_ids.astype("<u2", copy=False).tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "AnalysisRecord":
+        if data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("Not a serialized AnalysisRecord")
+        offset = len(_MAGIC)
+        (header_length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        header = json.loads(data[offset:offset + header_length])
+        offset += header_length
+
+        count = header['count']
+        boxes = np.frombuffer(data, dtype="<f4", count=count * 4, offset=offset)
+        offset += boxes.nbytes
+        scores = np.frombuffer(data, dtype="<f4", count=count, offset=offset)
+        offset += scores.nbytes
+        class_ids = np.frombuffer(data, dtype="<u2", count=count, offset=offset)
+
+        return cls(
+            image_size=tuple(header['image_size']),
+            # Copies, so the record doesn't keep the whole serialized buffer alive
+            boxes=boxes.reshape(-1, 4).astype(np.float32),
+            scores=scores.astype(np.float32),
+            class_ids=class_ids.astype(np.uint16),
+            labels=tuple(sys.intern(label) for label in header['labels']),
+            caption=header['caption'],
+            image_key=header['image_key'],
+        )
@@ -0,0 +1,252 @@
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+import re
+
+# Classes of the COCO-trained YOLOv8 models
+COCO_CLASSES = [
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat",
+    "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat",
+    "dog", "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack",
+    "umbrella", "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball",
+    "kite", "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket",
+    "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
+    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair",
+    "couch", "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse",
+    "remote", "keyboard", "cell phone", "microwave", "oven", "toaster", "sink",
+    "refrigerator", "book", "clock", "vase", "scissors", "teddy bear", "hair drier",
+    "toothbrush",
+]
+
+_IRREGULAR_PLURALS = {
+    "person": "people", "knife": "knives", "mouse": "mice", "sheep": "sheep",
+    "skis": "skis", "scissors": "scissors",
+}
+
+# Everyday words for classes, mapped to the class name
+_SYNONYMS = {
+    "man": "person", "men": "person", "woman": "person", "women": "person",
+    "kid": "person", "kids": "person", "child": "person", "children": "person",
+    "guy": "person", "guys": "person", "persons": "person", "humans": "person",
+    "phone": "cell phone", "phones": "cell phone", "table": "dining table",
+    "tables": "dining table", "plant": "potted plant", "plants": "potted plant",
+    "ball": "sports ball", "balls": "sports ball", "television": "tv", "tvs": "tv",
+    "bike": "bicycle", "bikes": "bicycle", "motorbike": "motorcycle", "sofa": "couch",
+    "fridge": "refrigerator", "plane": "airplane", "doughnut": "donut", "puppy": "dog",
+    "kitten": "cat",
+}
+
+_ROWS = ("top", "middle", "bottom")
+_COLS = ("left", "center", "right")
+
+_ROW_WORDS = {"top": "top", "upper": "top", "bottom": "bottom", "lower": "bottom"}
+_COL_WORDS = {"left": "left", "right": "right"}
+_CENTER_WORDS = {"center", "centre", "middle"}
+
+# Class names that are also colors; "anything orange" isn't about the fruit
+_COLOR_CLASS_WORDS = {"orange"}
+
+# Openings of yes/no questions
+_YES_NO_WORDS = ("is", "are", "do", "can", "does")
+
+_GENERIC_OBJECTS = {"object", "objects", "thing", "things", "item", "items"}
+
+# Words that carry no meaning beyond the recognized intent, class and region;
+# any other word makes the question open-ended and it goes to the LLM
+_FILLER_WORDS = {
+    "how", "many", "are", "is", "there", "the", "a", "an", "any", "in", "on", "at", "of",
+    "this", "that", "image", "picture", "photo", "scene", "do", "does", "you", "see", "can",
+    "where", "what", "whats", "s", "located", "which", "anything", "something", "side",
+    "corner", "part", "area", "visible", "i", "me", "tell", "count", "number", "total",
+    "some", "situated", "positioned", "exactly", "here", "find", "it", "have", "contain",
+    "contains", "show", "shows", "please", "to", "be", "seen", "its", "all",
+    "region", "portion", "half", "hand",
+} | _GENERIC_OBJECTS | set(_ROW_WORDS) | set(_COL_WORDS) | _CENTER_WORDS
+
+def plural(class_name: str) -> str:
+    if class_name in _IRREGULAR_PLURALS:
+        return _IRREGULAR_PLURALS[class_name]
+    if class_name.endswith(("s", "sh", "ch", "x")):
+        return class_name + "es"
+    return class_name + "s"
+
+def _count_phrase(count: int, class_name: str) -> str:
+    return f"{count} {class_name if count == 1 else plural(class_name)}"
+
+def _join(parts: List[str]) -> str:
+    return parts[0] if len(parts) == 1 else ", ".join(parts[:-1]) + f" and {parts[-1]}"
+
+def _build_aliases() -> Dict[str, str]:
+    aliases = dict(_SYNONYMS)
+    for class_name in COCO_CLASSES:
+        aliases[class_name] = class_name
+        aliases[plural(class_name)] = class_name
+    return aliases
+
+_ALIASES = _build_aliases()
+_ALIAS_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(a) for a in sorted(_ALIASES, key=len, reverse=True)) + r")\b"
+)
+
+class DetectionIndex:
+    """
+    Lookup structures over one image's detections
+
+    Built once per analysis: class counts, detections per class, and the
+    cell of each detection in the same 3x3 grid _get_position_description
+    uses, all ordered by box area so the most prominent object comes first.
+    """
+
+    def __init__(self, yolo_results: Dict):
+        self.results = yolo_results
+        width, height = yolo_results['image_size']
+
+        def area(det):
+            x1, y1, x2, y2 = det['bbox']
+            return (x2 - x1) * (y2 - y1)
+
+        self.by_area: List[Dict] = sorted(yolo_results['detections'], key=area, reverse=True)
+        self.counts: Counter = Counter(det['class'] for det in self.by_area)
+        self.by_class: Dict[str, List[Dict]] = {}
+        self.cells: List[Tuple[str, str]] = []  # Grid cell of each entry in by_area
+
+        for det in self.by_area:
+            x, y = det['center']
+            col = _COLS[min(2, max(0, int(3 * x / width)))]
+            row = _ROWS[min(2, max(0, int(3 * y / height)))]
+            self.by_class.setdefault(det['class'], []).append(det)
+            self.cells.append((row, col))
+
+    def in_region(self, rows: Set[str], cols: Set[str]) -> List[Dict]:
+        """Detections whose center falls in the given rows and columns, largest first"""
+        return [
+            det for det, (row, col) in zip(self.by_area, self.cells)
+            if row in rows and col in cols
+        ]
+
+class QueryInterpreter:
+    """
+    Answers counting, presence and location questions from a DetectionIndex
+
+    Only questions made entirely of a recognized intent, object class and
+    image region are answered; anything else (attributes, actions, open
+    questions) returns None and should go to the LLM.
+    """
+
+    def __init__(self, index: DetectionIndex):
+        self.index = index
+
+    def answer(self, question: str) -> Optional[str]:
+        text = question.lower().replace("'", "")
+        classes = []
+        for match in _ALIAS_PATTERN.finditer(text):
+            if match.group(1) in _COLOR_CLASS_WORDS:
+                return None
+            if _ALIASES[match.group(1)] not in classes:
+                classes.append(_ALIASES[match.group(1)])
+        remainder = _ALIAS_PATTERN.sub(" ", text)
+        words = re.findall(r"[a-z]+", remainder)
+
+        if not words or any(word not in _FILLER_WORDS for word in words):
+            return None
+        if len(classes) > 1:
+            return None
+
+        class_name = classes[0] if classes else None
+        region = self._parse_region(words)
+        generic = any(word in _GENERIC_OBJECTS for word in words) or "anything" in words
+
+        if "how" in words and "many" in words:
+            if region is not None:
+                return None
+            if class_name:
+                return self._count(class_name)
+            return self._total() if generic else None
+
+        if "where" in words:
+            return self._locate(class_name) if class_name and region is None else None
+
+        if region is not None:
+            if class_name:
+                # "Is the dog on the left?" hinges on where the boundary is drawn;
+                # the LLM can hedge from the positions in the context
+                if words[0] in _YES_NO_WORDS:
+                    return None
+                return self._class_in_region(class_name, region)
+            if generic or "what" in words or "whats" in words:
+                return self._describe_region(region)
+            return None
+
+        if class_name and words[0] in _YES_NO_WORDS:
+            return self._presence(class_name)
+        return None
+
+    @staticmethod
+    def _parse_region(words: List[str]) -> Optional[Tuple[Set[str], Set[str], str]]:
+        """(rows, cols, description) for a region named in the question"""
+        row = next((_ROW_WORDS[w] for w in words if w in _ROW_WORDS), None)
+        col = next((_COL_WORDS[w] for w in words if w in _COL_WORDS), None)
+        center = any(w in _CENTER_WORDS for w in words)
+
+        if row and col:
+            return {row}, {col}, f"in the {row} {col}"
+        if col and center:
+            return {"middle"}, {col}, f"in the middle {col}"
+        if row:
+            return {row}, ({"center"} if center else set(_COLS)), (
+                f"in the {row} center" if center else f"at the {row} of the image"
+            )
+        if col:
+            return set(_ROWS), {col}, f"on the {col} side"
+        if center:
+            return {"middle"}, {"center"}, "in the center of the image"
+        return None
+
+    def _count(self, class_name: str) -> str:
+        count = self.index.counts.get(class_name, 0)
+        if count == 0:
+            return f"I don't see any {plural(class_name)} in the image."
+        verb = "is" if count == 1 else "are"
+        return f"There {verb} {_count_phrase(count, class_name)} in the image."
+
+    def _total(self) -> str:
+        total = sum(self.index.counts.values())
+        if total == 0:
+            return "I didn't detect any specific objects in the image."
+        breakdown = _join([_count_phrase(n, c) for c, n in self.index.counts.most_common()])
+        return f"I can see {total} object{'s' if total != 1 else ''}: {breakdown}."
+
+    def _locate(self, class_name: str) -> str:
+        dets = self.index.by_class.get(class_name, [])
+        if not dets:
+            return f"I don't see any {plural(class_name)} in the image."
+        if len(dets) == 1:
+            return f"The {class_name} is at the {dets[0]['position']}."
+        others = _join([det['position'] for det in dets[1:]])
+        rest = "the other is" if len(dets) == 2 else "the others are"
+        return (f"There are {len(dets)} {plural(class_name)}: the largest is at the "
+                f"{dets[0]['position']}, and {rest} at the {others}.")
+
+    def _presence(self, class_name: str) -> str:
+        dets = self.index.by_class.get(class_name, [])
+        if not dets:
+            return f"No, I don't see any {plural(class_name)} in the image."
+        positions = _join(list(dict.fromkeys(det['position'] for det in dets)))
+        if len(dets) == 1:
+            return f"Yes, there is a {class_name} at the {positions}."
+        return f"Yes, there are {len(dets)} {plural(class_name)}, at the {positions}."
+
+    def _class_in_region(self, class_name: str, region) -> str:
+        rows, cols, description = region
+        count = sum(det['class'] == class_name for det in self.index.in_region(rows, cols))
+        if count == 0:
+            return f"No, I don't see any {plural(class_name)} {description}."
+        verb = "is" if count == 1 else "are"
+        return f"Yes, there {verb} {_count_phrase(count, class_name)} {description}."
+
+    def _describe_region(self, region) -> str:
+        rows, cols, description = region
+        counts = Counter(det['class'] for det in self.index.in_region(rows, cols))
+        if not counts:
+            return f"I don't see any detected objects {description}."
+        found = _join([_count_phrase(n, c) for c, n in counts.most_common()])
+        return f"{description[0].upper()}{description[1:]} I can see {found}."
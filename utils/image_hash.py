@@ -0,0 +1,159 @@
+from PIL import Image
+from typing import Dict, Iterator, List, Optional, Tuple
+import threading
+import numpy as np
+from config import Config
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+_DCT_32 = _dct_matrix(32)
+
+def phash(image: Image.Image) -> int:
+    """64-bit perceptual hash from the low frequencies of a 32x32 DCT"""
+    pixels = np.asarray(
+        image.convert('L').resize((32, 32), Image.Resampling.BILINEAR), dtype=np.float64
+    )
+    low = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8].flatten()
+    # The DC term only reflects overall brightness
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash from horizontal gradients of a 9x8 thumbnail"""
+    pixels = np.asarray(
+        image.convert('L').resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16
+    )
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class HashIndex:
+    """
+    Hamming-distance lookup over 64-bit hashes via multi-index hashing
+
+    Each hash is split into max_distance + 1 bands. By the pigeonhole
+    principle, any hash within max_distance of the query matches it exactly
+    on at least one band, so only entries sharing a band bucket are compared.
+    With 5-6 bands of 10-11 bits, buckets stay small even at hundreds of
+    thousands of entries, keeping lookups well under a millisecond.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        num_bands = max_distance + 1
+        widths = [64 // num_bands + (1 if i < 64 % num_bands else 0) for i in range(num_bands)]
+
+        self._bands = []
+        shift = 64
+        for width in widths:
+            shift -= width
+            self._bands.append((shift, (1 << width) - 1))
+
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in self._bands]
+        self._hashes: List[Optional[int]] = []
+        self._values: List[object] = []
+        self._free: List[int] = []  # Slots of removed entries, reused by add
+
+    def __len__(self) -> int:
+        return len(self._hashes) - len(self._free)
+
+    def add(self, hash_value: int, value: object) -> int:
+        """Index a value under its hash; returns the entry id for remove"""
+        if self._free:
+            entry = self._free.pop()
+            self._hashes[entry] = hash_value
+            self._values[entry] = value
+        else:
+            entry = len(self._hashes)
+            self._hashes.append(hash_value)
+            self._values.append(value)
+        for buckets, (shift, mask) in zip(self._buckets, self._bands):
+            buckets.setdefault((hash_value >> shift) & mask, []).append(entry)
+        return entry
+
+    def remove(self, entry: int):
+        hash_value = self._hashes[entry]
+        for buckets, (shift, mask) in zip(self._buckets, self._bands):
+            band = (hash_value >> shift) & mask
+            bucket = buckets[band]
+            bucket.remove(entry)
+            if not bucket:
+                del buckets[band]
+        self._hashes[entry] = None
+        self._values[entry] = None
+        self._free.append(entry)
+
+    def search(self, hash_value: int) -> List[Tuple[int, object]]:
+        """All (distance, value) within max_distance, closest first"""
+        seen = set()
+        matches = []
+        for buckets, (shift, mask) in zip(self._buckets, self._bands):
+            for entry in buckets.get((hash_value >> shift) & mask, ()):
+                if entry in seen:
+                    continue
+                seen.add(entry)
+                distance = (self._hashes[entry] ^ hash_value).bit_count()
+                if distance <= self.max_distance:
+                    matches.append((distance, self._values[entry]))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+class NearDuplicateIndex:
+    """
+    Finds previously analyzed images that look the same as a new one
+
+    Candidates come from the pHash index and must also agree on dHash and
+    have a similar aspect ratio, which filters crops and unrelated images
+    that happen to collide.
+    """
+
+    def __init__(self, max_distance: int = Config.PHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._index = HashIndex(max_distance)
+        self._entries: Dict[str, Tuple[int, Tuple[int, int], int]] = {}  # dHash, size, entry id
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @staticmethod
+    def hashes(image: Image.Image) -> Tuple[int, int]:
+        """(pHash, dHash) of an image"""
+        return phash(image), dhash(image)
+
+    def add(self, key: str, hashes: Tuple[int, int], size: Tuple[int, int]):
+        with self._lock:
+            if key in self._entries:
+                return
+            entry = self._index.add(hashes[0], key)
+            self._entries[key] = (hashes[1], size, entry)
+
+    def remove(self, key: str):
+        """Forget an image, e.g. when its analysis is evicted"""
+        with self._lock:
+            stored = self._entries.pop(key, None)
+            if stored is not None:
+                self._index.remove(stored[2])
+
+    def find(self, hashes: Tuple[int, int], size: Tuple[int, int]) -> Iterator[str]:
+        """Keys of all near-duplicates, closest first"""
+        aspect = size[0] / size[1]
+        keys = []
+        with self._lock:
+            for _, key in self._index.search(hashes[0]):
+                candidate_dhash, candidate_size, _ = self._entries[key]
+                if hamming(candidate_dhash, hashes[1]) > self.max_distance:
+                    continue
+                if abs(candidate_size[0] / candidate_size[1] - aspect) > 0.05 * aspect:
+                    continue
+                keys.append(key)
+        # Yielded after the lock is released, so callers can load each match in turn
+        yield from keys
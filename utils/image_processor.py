@@ -1,40 +1,108 @@
-from PIL import Image
+from PIL import Image, ImageOps
+from typing import Dict, Union
+import io
 import os
 from config import Config
 
 class ImageProcessor:
     @staticmethod
-    def preprocess_image(image_path: str) -> str:
+    def _open(image: Union[str, bytes]) -> Image.Image:
         """
-        Preprocess image (resize if too large, convert format if needed)
-        Returns path to processed image
+        Decode an image no larger than needed, upright per its EXIF orientation
+        
+        JPEGs are decoded by libjpeg at 1/2, 1/4 or 1/8 scale (in the DCT
+        domain) when that still covers Config.MAX_IMAGE_SIZE, so a phone photo
+        is never materialized at full resolution. Other formats can't be
+        decoded at reduced size and are refused above Config.MAX_SOURCE_PIXELS.
         """
+        img = Image.open(io.BytesIO(image) if isinstance(image, bytes) else image)
+        if img.format == "JPEG":
+            img.draft("RGB", Config.MAX_IMAGE_SIZE)
+        elif img.size[0] * img.size[1] > Config.MAX_SOURCE_PIXELS:
+            raise ValueError(f"Image of {img.size[0]}x{img.size[1]} pixels is too large")
+        
+        return ImageOps.exif_transpose(img)
+    
+    @staticmethod
+    def _prepare(img: Image.Image) -> Image.Image:
+        """Convert to RGB and shrink to Config.MAX_IMAGE_SIZE"""
+        # Convert to RGB if needed
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Resize if too large
+        if img.size[0] > Config.MAX_IMAGE_SIZE[0] or img.size[1] > Config.MAX_IMAGE_SIZE[1]:
+            img.thumbnail(Config.MAX_IMAGE_SIZE, Image.Resampling.LANCZOS)
+        
+        return img
+    
+    @staticmethod
+    def load(image: Union[str, bytes]) -> Image.Image:
+        """Decode a file path or in-memory bytes into the preprocessed RGB image"""
+        return ImageProcessor._prepare(ImageProcessor._open(image))
+    
+    @staticmethod
+    def save_processed(image_path: str, img: Image.Image) -> str:
+        """Save a preprocessed image next to its original; returns its path"""
         try:
-            img = Image.open(image_path)
-            
-            # Convert to RGB if needed
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize if too large
-            if img.size[0] > Config.MAX_IMAGE_SIZE[0] or img.size[1] > Config.MAX_IMAGE_SIZE[1]:
-                img.thumbnail(Config.MAX_IMAGE_SIZE, Image.Resampling.LANCZOS)
-            
-            # Save processed image
             processed_path = image_path.replace('.', '_processed.')
             img.save(processed_path)
-            
             return processed_path
+        except Exception as e:
+            print(f"Error saving processed image: {e}")
+            return image_path
+    
+    @staticmethod
+    def preprocess_image(image_path: str) -> str:
+        """
+        Preprocess image (resize if too large, convert format if needed)
+        Returns path to processed image
+        """
+        try:
+            return ImageProcessor.save_processed(image_path, ImageProcessor.load(image_path))
         except Exception as e:
             print(f"Error preprocessing image: {e}")
             return image_path
     
     @staticmethod
-    def validate_image(image_path: str) -> bool:
-        """Validate if file is a valid image"""
+    def preprocess_image_bytes(data: bytes) -> Image.Image:
+        """
+        Preprocess an image held in memory (e.g. an API upload)
+        Returns the processed RGB image without touching the filesystem
+        """
+        return ImageProcessor.load(data)
+    
+    @staticmethod
+    def model_inputs(img: Image.Image) -> Dict[str, Image.Image]:
+        """
+        Inputs sized for each model, resized once from the preprocessed image
+        
+        'yolo' has its long side at Config.YOLO_IMGSZ (YOLO's own letterbox
+        then only pads); 'blip' is the square Config.BLIP_IMAGE_SIZE input the
+        BLIP-2 processor would otherwise resize to.
+        """
+        scale = Config.YOLO_IMGSZ / max(img.size)
+        yolo_input = img
+        if scale < 1:
+            yolo_input = img.resize(
+                (max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale))),
+                Image.Resampling.BILINEAR
+            )
+        
+        blip_size = (Config.BLIP_IMAGE_SIZE, Config.BLIP_IMAGE_SIZE)
+        return {
+            'yolo': yolo_input,
+            'blip': img.resize(blip_size, Image.Resampling.BICUBIC),
+        }
+    
+    @staticmethod
+    def validate_image(image: Union[str, bytes]) -> bool:
+        """Validate if a file path or in-memory bytes hold a valid image"""
         try:
-            img = Image.open(image_path)
+            img = Image.open(io.BytesIO(image) if isinstance(image, bytes) else image)
+            if img.format != "JPEG" and img.size[0] * img.size[1] > Config.MAX_SOURCE_PIXELS:
+                return False
             img.verify()
             return True
         except:
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,27 @@
+import threading
+import torch
+from config import Config
+
+_configured = False
+_configure_lock = threading.Lock()
+
+def configure_torch_threads():
+    """
+    Apply Config's intra-/inter-op thread counts once per process
+
+    The inter-op pool can only be sized before torch first uses it, so this
+    runs before any model is loaded; later calls are no-ops.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+
+        if Config.TORCH_INTRA_OP_THREADS:
+            torch.set_num_threads(Config.TORCH_INTRA_OP_THREADS)
+        if Config.TORCH_INTER_OP_THREADS:
+            try:
+                torch.set_num_interop_threads(Config.TORCH_INTER_OP_THREADS)
+            except RuntimeError as e:
+                print(f"Could not set inter-op threads: {e}")
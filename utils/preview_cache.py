@@ -0,0 +1,88 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import hashlib
+import json
+import os
+import uuid
+import numpy as np
+from PIL import Image
+from config import Config
+
+MEDIA_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+_SUFFIXES = {"WEBP": ".webp", "JPEG": ".jpg", "PNG": ".png"}
+
+def detections_digest(detections: List[Dict]) -> str:
+    """Short hash of the boxes drawn, so a re-analysis of the same image gets its own preview"""
+    drawn = [(det['class'], round(det['confidence'], 2), det['bbox']) for det in detections]
+    return hashlib.sha1(json.dumps(drawn).encode()).hexdigest()[:12]
+
+class PreviewCache:
+    """
+    Encoded annotated images on disk, one file per image, detections and size
+
+    A preview is rendered and encoded (WebP by default) the first time it is
+    asked for; later requests for the same image, from any session or
+    worker sharing the directory, return the existing file. The oldest files
+    are removed once Config.PREVIEW_CACHE_MAX_FILES is exceeded; a hit
+    refreshes the file's mtime, so those are the least recently used.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_files: Optional[int] = None):
+        self.directory = Path(directory or Config.PREVIEW_CACHE_DIR)
+        self.max_files = max_files or Config.PREVIEW_CACHE_MAX_FILES
+        self._writes = 0
+
+    def get(self, key: str, render: Callable[[], np.ndarray],
+            image_format: Optional[str] = None, quality: Optional[int] = None) -> str:
+        """
+        Path of the encoded image for key, calling render only on a miss
+
+        Args:
+            key: Identifies the image, its detections and the rendered size
+            render: Returns the annotated RGB array
+            image_format: WEBP, JPEG or PNG (default Config.ANNOTATION_PREVIEW_FORMAT)
+            quality: Encoder quality for WEBP and JPEG
+        """
+        image_format = (image_format or Config.ANNOTATION_PREVIEW_FORMAT).upper()
+        quality = quality or Config.ANNOTATION_PREVIEW_QUALITY
+        path = self.directory / f"{key}-q{quality}{_SUFFIXES[image_format]}"
+        try:
+            # Touch on a hit so eviction by mtime drops the least recently used previews
+            os.utime(path)
+            return str(path)
+        except FileNotFoundError:
+            pass
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        options = {} if image_format == "PNG" else {"quality": quality}
+        if image_format == "WEBP":
+            options["method"] = 4  # Encoder effort; 6 is much slower for a few percent
+        elif image_format == "JPEG":
+            options["optimize"] = True
+
+        # Write under a unique name and move into place so readers never see a partial file
+        tmp_path = path.with_name(f".{uuid.uuid4().hex}{path.suffix}")
+        try:
+            Image.fromarray(render()).save(tmp_path, format=image_format, **options)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self._evict()
+        return str(path)
+
+    def _evict(self):
+        """Remove the oldest previews beyond max_files"""
+        try:
+            files = sorted(
+                (entry for entry in os.scandir(self.directory) if entry.is_file()),
+                key=lambda entry: entry.stat().st_mtime
+            )
+            for entry in files[:max(0, len(files) - self.max_files)]:
+                os.remove(entry.path)
+        except OSError as e:
+            # Another worker may be evicting the same files
+            print(f"Preview cache eviction incomplete: {e}")
@@ -0,0 +1,122 @@
+from collections import Counter
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Optional
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from config import Config
+
+def should_profile(requested: Optional[bool] = None) -> bool:
+    """An explicit request wins; otherwise sample Config.PROFILE_SAMPLE_RATE of requests"""
+    if requested is not None:
+        return requested
+    return Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE
+
+def request_profile(name: str, requested: Optional[bool] = None):
+    """
+    Context manager profiling one request if it is selected
+
+    Unselected requests get a nullcontext, so the cost when profiling is off
+    is a single comparison.
+    """
+    if not should_profile(requested):
+        return nullcontext()
+    return RequestProfiler(name)
+
+class RequestProfiler:
+    """
+    Stack-sampling profiler for the thread handling one request
+
+    A background thread reads the request thread's stack from
+    sys._current_frames() every Config.PROFILE_INTERVAL_MS and counts
+    identical stacks. On exit the counts are written in collapsed-stack
+    format ("outer;inner count" per line), which flamegraph.pl and
+    speedscope render directly. Native code (torch kernels, PIL decoding)
+    shows up as time in the Python function that called it, so torch's own
+    profiler additionally records an op-level table when available.
+    """
+
+    def __init__(self, name: str, output_dir: Optional[str] = None,
+                 interval_ms: Optional[float] = None, torch_ops: Optional[bool] = None):
+        self.name = name
+        self.output_dir = Path(output_dir or Config.PROFILE_DIR)
+        self.interval_s = (interval_ms or Config.PROFILE_INTERVAL_MS) / 1000
+        self.torch_ops = Config.PROFILE_TORCH_OPS if torch_ops is None else torch_ops
+
+        self.stacks: Counter = Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._torch_profiler = None
+        self._started = 0.0
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+        if self.torch_ops:
+            self._start_torch_profiler()
+        self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._sampler.join()
+        elapsed_ms = (time.perf_counter() - self._started) * 1000
+        if self._torch_profiler is not None:
+            self._torch_profiler.__exit__(exc_type, exc, tb)
+        try:
+            path = self._write()
+            print(f"Profile of {self.name} ({elapsed_ms:.0f} ms, "
+                  f"{sum(self.stacks.values())} samples) written to {path}")
+        except OSError as e:
+            print(f"Could not write profile: {e}")
+        return False
+
+    def _start_torch_profiler(self):
+        try:
+            import torch
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._torch_profiler = torch.profiler.profile(activities=activities)
+            self._torch_profiler.__enter__()
+        except Exception as e:
+            # Only one torch profiler can run at a time per process
+            print(f"Torch op profiling unavailable: {e}")
+            self._torch_profiler = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    .replace(";", ":")
+                )
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def _write(self) -> Path:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-{uuid.uuid4().hex[:6]}"
+
+        path = self.output_dir / f"{stem}.collapsed"
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        if self._torch_profiler is not None:
+            with open(self.output_dir / f"{stem}.ops.txt", "w") as f:
+                f.write(self._torch_profiler.key_averages().table(
+                    sort_by="self_cpu_time_total", row_limit=50
+                ))
+        return path
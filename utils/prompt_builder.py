@@ -25,4 +25,44 @@ class PromptBuilder:
         else:
             context_parts.append("\nNo specific objects detected by the detector.")
         
+        return "\n".join(context_parts)
+    
+    @staticmethod
+    def build_quick_description(yolo_results: Dict, blip_caption: str) -> str:
+        """
+        Build a description of the image without the LLM, shown while the
+        LLM's opening response is being generated
+        """
+        caption = blip_caption.strip().rstrip(".")
+        description = f"{caption[:1].upper()}{caption[1:]}." if caption else ""
+        
+        if yolo_results and yolo_results['total_objects'] > 0:
+            description += f"\n\n{yolo_results['structured_info']}"
+        
+        return description.strip()
+    
+    @staticmethod
+    def build_video_context(video_results: Dict) -> str:
+        """
+        Build a compact scene-by-scene timeline context for a video clip
+        """
+        segments = video_results['segments']
+        context_parts = [
+            f"Video Clip: {video_results['duration']:.1f} seconds, {len(segments)} scene(s)."
+        ]
+        
+        context_parts.append("\nTimeline:")
+        for i, segment in enumerate(segments, 1):
+            context_parts.append(
+                f"Scene {i} ({segment['start']:.1f}s - {segment['end']:.1f}s): {segment['caption']}"
+            )
+            if segment['objects']:
+                objects = ", ".join(
+                    f"{count} {class_name}{'s' if count > 1 else ''} (mostly at {segment['positions'][class_name]})"
+                    for class_name, count in sorted(segment['objects'].items(), key=lambda item: -item[1])
+                )
+                context_parts.append(f"   Objects: {objects}")
+            else:
+                context_parts.append("   No specific objects detected by the detector.")
+        
         return "\n".join(context_parts)
\ No newline at end of file
@@ -0,0 +1,298 @@
+import hashlib
+import io
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from PIL import Image
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from config import Config
+from utils.analysis_record import AnalysisRecord
+
+class ResultStore:
+    """
+    Local persistence for image analyses and conversation state
+
+    Records live in SQLite (WAL mode, so several worker processes can share
+    one store) and preprocessed images in a blob directory next to it.
+    Writes are queued and applied by a background thread so they never
+    block a request; reads happen on the caller's thread.
+    """
+
+    # yolo_results holds the JSON analysis of rows written before the record column
+    IMAGES_TABLE = """
+        CREATE TABLE IF NOT EXISTS {name} (
+            image_key TEXT PRIMARY KEY,
+            blob_name TEXT NOT NULL,
+            yolo_results TEXT,
+            blip_caption TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            phash INTEGER,
+            dhash INTEGER,
+            width INTEGER,
+            height INTEGER,
+            record BLOB
+        );
+    """
+    IMAGE_COLUMNS = (
+        "image_key, blob_name, yolo_results, blip_caption, created_at, "
+        "phash, dhash, width, height, record"
+    )
+
+    SCHEMA = IMAGES_TABLE.format(name="images") + """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            image_key TEXT,
+            thread_id TEXT NOT NULL,
+            messages TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            video_caption TEXT,
+            video_context TEXT,
+            keyframe_blob TEXT
+        );
+    """
+
+    def __init__(self, store_dir: str = Config.RESULT_STORE_DIR):
+        self.store_dir = Path(store_dir)
+        self.blob_dir = self.store_dir / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.store_dir / "results.db"
+
+        # sqlite3 connections can't be shared across threads
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Worker processes open the store together; one at a time creates or upgrades it
+        conn.execute("BEGIN IMMEDIATE")
+        with conn:
+            for statement in self.SCHEMA.split(";"):
+                conn.execute(statement)
+            
+            # Stores created before perceptual hashing lack these columns
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(images)")}
+            for column in ("phash", "dhash", "width", "height"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE images ADD COLUMN {column} INTEGER")
+            # Older stores keep the analysis as JSON only
+            if "record" not in columns:
+                conn.execute("ALTER TABLE images ADD COLUMN record BLOB")
+            # and declare the JSON columns NOT NULL, including the unused image_context
+            if "image_context" in columns:
+                self._migrate_images_table(conn)
+            # Nor do they keep video sessions' timelines
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(sessions)")}
+            for column in ("video_caption", "video_context", "keyframe_blob"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} TEXT")
+
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _migrate_images_table(self, conn: sqlite3.Connection):
+        """Rebuild the images table without image_context and with yolo_results nullable"""
+        conn.execute(self.IMAGES_TABLE.format(name="images_migrated"))
+        conn.execute(
+            f"INSERT INTO images_migrated ({self.IMAGE_COLUMNS}) "
+            f"SELECT {self.IMAGE_COLUMNS} FROM images"
+        )
+        conn.execute("UPDATE images_migrated SET yolo_results = NULL WHERE yolo_results = ''")
+        conn.execute("DROP TABLE images")
+        conn.execute("ALTER TABLE images_migrated RENAME TO images")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Per-thread connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def image_key(image: Union[str, bytes]) -> str:
+        """Content hash identifying an image file or encoded image bytes"""
+        if isinstance(image, bytes):
+            return hashlib.sha256(image).hexdigest()
+
+        digest = hashlib.sha256()
+        with open(image, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _to_signed(value: int) -> int:
+        """SQLite integers are signed 64-bit"""
+        return value - (1 << 64) if value >= (1 << 63) else value
+
+    @staticmethod
+    def _to_unsigned(value: int) -> int:
+        return value + (1 << 64) if value < 0 else value
+
+    def _write_loop(self):
+        """Apply queued writes in order"""
+        while True:
+            write, args = self._writes.get()
+            try:
+                write(*args)
+            except Exception as e:
+                print(f"Error persisting results: {e}")
+            finally:
+                self._writes.task_done()
+
+    def flush(self):
+        """Block until every queued write has been applied"""
+        self._writes.join()
+
+    def save_image_async(self, image_key: str, image: Union[str, Image.Image],
+                         record: AnalysisRecord, hashes: Optional[Tuple[int, int]] = None):
+        """
+        Queue an image analysis record and its blob (file path or PIL image) for writing
+
+        hashes are the image's (pHash, dHash), used to find near-duplicates
+        """
+        self._writes.put((self._save_image, (image_key, image, record, hashes)))
+
+    def save_session_async(self, session_id: str, image_key: Optional[str],
+                           thread_id: str, messages: List[Dict], video: Optional[Dict] = None):
+        """
+        Queue a session's conversation state for writing
+
+        video holds a video session's 'caption', 'context' (the scene
+        timeline) and 'keyframe' (file path or PIL image), which it has
+        instead of an image analysis
+        """
+        self._writes.put((self._save_session, (
+            session_id, image_key, thread_id, list(messages), video
+        )))
+
+    def _write_blob(self, blob_name: str, image: Union[str, bytes, Image.Image]):
+        """Copy, write or encode an image into the blob directory, unless already there"""
+        blob_path = self.blob_dir / blob_name
+        if blob_path.exists():
+            return
+        # Per-process temporary name; worker processes sharing the store may write the same blob
+        tmp_path = blob_path.with_name(f"{blob_path.name}.{os.getpid()}.tmp")
+        if isinstance(image, str):
+            shutil.copyfile(image, tmp_path)
+        elif isinstance(image, bytes):
+            tmp_path.write_bytes(image)
+        else:
+            image.save(tmp_path, format="JPEG", quality=95)
+        tmp_path.replace(blob_path)
+
+    def _save_image(self, image_key: str, image: Union[str, Image.Image],
+                    record: AnalysisRecord, hashes: Optional[Tuple[int, int]]):
+        suffix = Path(image).suffix if isinstance(image, str) else ".jpg"
+        blob_name = image_key + suffix
+        self._write_blob(blob_name, image)
+
+        phash, dhash = (self._to_signed(h) for h in hashes) if hashes else (None, None)
+        width, height = record.image_size
+
+        # The context is derived from the serialized record when loaded
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO images (image_key, blob_name, blip_caption, "
+                "created_at, phash, dhash, width, height, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (image_key, blob_name, record.caption, time.time(),
+                 phash, dhash, width, height, record.to_bytes())
+            )
+
+    def _save_session(self, session_id: str, image_key: Optional[str],
+                      thread_id: str, messages: List[Dict], video: Optional[Dict]):
+        video_caption = video_context = keyframe_blob = None
+        if video:
+            video_caption, video_context = video['caption'], video['context']
+            keyframe = video['keyframe']
+            if isinstance(keyframe, Image.Image):
+                buffer = io.BytesIO()
+                keyframe.save(buffer, format="JPEG", quality=95)
+                keyframe = buffer.getvalue()
+            if keyframe is not None:
+                # Named by content, so re-saving a rehydrated session reuses its blob
+                suffix = Path(keyframe).suffix if isinstance(keyframe, str) else ".jpg"
+                keyframe_blob = self.image_key(keyframe) + suffix
+                self._write_blob(keyframe_blob, keyframe)
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, image_key, thread_id, messages, "
+                "updated_at, video_caption, video_context, keyframe_blob) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, image_key, thread_id, json.dumps(messages), time.time(),
+                 video_caption, video_context, keyframe_blob)
+            )
+
+    def load_image(self, image_key: str) -> Optional[Dict]:
+        """Stored analysis for an image, or None"""
+        row = self._connect().execute(
+            "SELECT * FROM images WHERE image_key = ?", (image_key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        image_path = str(self.blob_dir / row["blob_name"])
+        if row["record"] is not None:
+            record = AnalysisRecord.from_bytes(row["record"])
+        else:
+            yolo_results = json.loads(row["yolo_results"])
+            if not yolo_results.get('image_size'):
+                with Image.open(image_path) as img:
+                    yolo_results['image_size'] = img.size
+            record = AnalysisRecord.from_yolo_results(
+                yolo_results, row["blip_caption"], image_key
+            )
+
+        return {
+            'image_key': image_key,
+            'image_path': image_path,
+            'record': record,
+        }
+
+    def iter_image_hashes(self) -> Iterator[Tuple[str, Tuple[int, int], Tuple[int, int]]]:
+        """(image_key, (pHash, dHash), (width, height)) of every hashed image"""
+        rows = self._connect().execute(
+            "SELECT image_key, phash, dhash, width, height FROM images "
+            "WHERE phash IS NOT NULL AND width IS NOT NULL"
+        )
+        for row in rows:
+            yield (
+                row["image_key"],
+                (self._to_unsigned(row["phash"]), self._to_unsigned(row["dhash"])),
+                (row["width"], row["height"])
+            )
+
+    def load_session(self, session_id: str) -> Optional[Dict]:
+        """Stored conversation state for a session, or None"""
+        row = self._connect().execute(
+            "SELECT * FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        video = None
+        if row["video_context"] is not None:
+            video = {
+                'caption': row["video_caption"],
+                'context': row["video_context"],
+                'keyframe_path': (
+                    str(self.blob_dir / row["keyframe_blob"]) if row["keyframe_blob"] else None
+                ),
+            }
+
+        return {
+            'session_id': session_id,
+            'image_key': row["image_key"],
+            'thread_id': row["thread_id"],
+            'messages': json.loads(row["messages"]),
+            'video': video,
+        }
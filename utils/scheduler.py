@@ -0,0 +1,214 @@
+from concurrent.futures import Future
+from collections import deque
+from typing import Callable, Dict, Optional
+import heapq
+import itertools
+import threading
+import time
+from config import Config
+
+class QueueFull(Exception):
+    """Raised when a work class already has too many requests waiting"""
+
+class DeadlineExceeded(Exception):
+    """Raised when a request is shed because it can't start before its deadline"""
+
+class WorkClass:
+    """
+    One queue of work with its own worker threads
+
+    Requests are ordered by priority, then by a start-time fair queueing
+    tag per user so a burst from one user can't starve the others.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queued: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._virtual_time = 0.0
+        self._user_tags: Dict[str, float] = {}
+
+        self.running = 0
+        self.completed = 0
+        self.shed = 0
+        self.rejected = 0
+        self._wait_ms = deque(maxlen=1000)
+        self._service_ms = deque(maxlen=100)
+
+        for i in range(concurrency):
+            threading.Thread(
+                target=self._worker, name=f"{name}-worker-{i}", daemon=True
+            ).start()
+
+    def submit(self, fn: Callable, user_id: str, priority: int,
+               deadline: Optional[float]) -> Future:
+        """Queue fn() and return a Future for its result"""
+        future = Future()
+        with self._cond:
+            if len(self._heap) >= self.max_queued:
+                self.rejected += 1
+                raise QueueFull(f"{self.name} queue is full")
+
+            # Shed up front if the expected wait already overshoots the deadline
+            if deadline is not None and time.monotonic() + self._expected_wait_s() > deadline:
+                self.shed += 1
+                raise DeadlineExceeded(f"{self.name} queue can't meet the deadline")
+
+            if len(self._user_tags) > 2 * self.max_queued:
+                self._prune_user_tags()
+            tag = max(self._virtual_time, self._user_tags.get(user_id, 0.0)) + 1
+            self._user_tags[user_id] = tag
+            heapq.heappush(self._heap, (
+                priority, tag, next(self._seq), time.monotonic(), deadline, fn, future
+            ))
+            self._cond.notify()
+        return future
+
+    def _prune_user_tags(self):
+        """
+        Forget users whose tag the virtual time has passed
+
+        Such a tag and a missing one both start the user's next request at
+        the virtual time, so only users with queued work are kept. The
+        caller holds the lock.
+        """
+        self._user_tags = {
+            user_id: tag for user_id, tag in self._user_tags.items() if tag > self._virtual_time
+        }
+
+    def _expected_wait_s(self) -> float:
+        """Queued work ahead of a new request, spread over the workers"""
+        if not self._service_ms:
+            return 0.0
+        mean_service_s = sum(self._service_ms) / len(self._service_ms) / 1000
+        backlog = len(self._heap) + self.running
+        return max(0, backlog - self.concurrency + 1) * mean_service_s / self.concurrency
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, tag, _, queued_at, deadline, fn, future = heapq.heappop(self._heap)
+                self._virtual_time = max(self._virtual_time, tag)
+                started = time.monotonic()
+                self._wait_ms.append((started - queued_at) * 1000)
+
+                # The caller may have given up already; its future can't take a result
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and started > deadline:
+                    self.shed += 1
+                    future.set_exception(DeadlineExceeded(f"{self.name} request expired in queue"))
+                    continue
+                self.running += 1
+
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+            with self._cond:
+                self.running -= 1
+                self.completed += 1
+                self._service_ms.append((time.monotonic() - started) * 1000)
+
+    def stats(self) -> Dict:
+        """Queue depth, outcomes and queue wait percentiles"""
+        with self._cond:
+            waits = sorted(self._wait_ms)
+            queued = len(self._heap)
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+        return {
+            'queued': queued,
+            'running': self.running,
+            'completed': self.completed,
+            'shed': self.shed,
+            'rejected': self.rejected,
+            'wait_ms': {
+                'p50': percentile(0.50),
+                'p95': percentile(0.95),
+                'max': waits[-1] if waits else 0.0,
+            },
+        }
+
+class PipelineScheduler:
+    """
+    Admission control in front of ConversationalImageChatbot
+
+    Heavy vision work (YOLO, BLIP captioning and VQA) and light chat turns
+    that only need the LLM get separate queues and concurrency limits, so a
+    burst of uploads can't starve follow-up questions. Turns in an ongoing
+    conversation are prioritized over new analyses within a class.
+    """
+
+    VISION = "vision"
+    CHAT = "chat"
+
+    PRIORITY_CONVERSATION = 0
+    PRIORITY_NORMAL = 1
+
+    def __init__(self, chatbot):
+        self.chatbot = chatbot
+        # Lets the chatbot queue its own follow-up work, e.g. opening responses
+        chatbot.scheduler = self
+        self.classes = {
+            self.VISION: WorkClass(
+                self.VISION, Config.SCHEDULER_VISION_CONCURRENCY, Config.SCHEDULER_MAX_QUEUED
+            ),
+            self.CHAT: WorkClass(
+                self.CHAT, Config.SCHEDULER_CHAT_CONCURRENCY, Config.SCHEDULER_MAX_QUEUED
+            ),
+        }
+
+    def submit(self, work_class: str, fn: Callable, user_id: str = "anonymous",
+               priority: int = PRIORITY_NORMAL, timeout_s: Optional[float] = None) -> Future:
+        """Queue arbitrary work on a class; requests not started within timeout_s are shed"""
+        deadline = time.monotonic() + timeout_s if timeout_s is not None else None
+        return self.classes[work_class].submit(fn, user_id, priority, deadline)
+
+    def submit_analysis(self, image, session_id: Optional[str] = None,
+                        user_id: Optional[str] = None, profile: Optional[bool] = None) -> Future:
+        """Queue process_new_image as vision work"""
+        return self.submit(
+            self.VISION,
+            lambda: self.chatbot.process_new_image(image, session_id, profile=profile),
+            user_id=user_id or session_id or "anonymous",
+            timeout_s=Config.SCHEDULER_VISION_DEADLINE_S
+        )
+
+    def submit_chat(self, message: str, session_id: Optional[str] = None,
+                    user_id: Optional[str] = None, fn: Optional[Callable] = None,
+                    profile: Optional[bool] = None, backend: Optional[str] = None) -> Future:
+        """
+        Queue a chat turn (or a custom fn serving it, e.g. a stream)
+
+        Turns that need BLIP VQA count as vision work. Sessions that already
+        have an analyzed image are in-progress conversations and jump ahead.
+        """
+        session = self.chatbot.get_session(session_id)
+        work_class = self.VISION if self.chatbot.needs_visual_answer(message, session) else self.CHAT
+        priority = (
+            self.PRIORITY_CONVERSATION if session.has_context
+            else self.PRIORITY_NORMAL
+        )
+        return self.submit(
+            work_class,
+            fn or (lambda: self.chatbot.chat(
+                message, session_id, profile=profile, backend=backend
+            )),
+            user_id=user_id or session_id or "anonymous",
+            priority=priority,
+            timeout_s=Config.SCHEDULER_CHAT_DEADLINE_S
+        )
+
+    def stats(self) -> Dict:
+        """Per-class queue statistics, including queue wait time"""
+        return {name: work_class.stats() for name, work_class in self.classes.items()}
@@ -0,0 +1,73 @@
+from concurrent.futures import Future
+from PIL import Image
+from typing import Dict, Optional, Union
+import time
+from utils.analysis_record import AnalysisRecord
+from utils.detection_index import DetectionIndex
+
+class ImageSession:
+    """Analysis results and conversation thread for one chat about one image"""
+
+    def __init__(self, session_id: str, thread_id: str):
+        self.session_id = session_id
+        self.thread_id = thread_id
+        self.last_used = time.monotonic()  # For idle eviction
+
+        # Image analysis, set by process_new_image or rehydrated from the store
+        self.image_key: Optional[str] = None
+        self.image_path: Optional[str] = None
+        self.image: Optional[Image.Image] = None  # In-memory uploads have no path
+        self.model_inputs: Dict[str, Image.Image] = {}  # Per-model resized copies of image
+        self.source: Optional[Union[str, bytes]] = None
+        self.analysis: Optional[AnalysisRecord] = None
+
+        # A video clip has no analysis record, only a keyframe caption and a timeline
+        self.video_caption: Optional[str] = None
+        self.video_context: Optional[str] = None
+
+        # Prefetched BLIP VQA answers by probe name
+        self.vqa_answers: Dict[str, str] = {}
+
+        # LLM opening response still being generated in fast-first-response mode
+        self.pending_response: Optional[Future] = None
+
+        self._detection_index: Optional[DetectionIndex] = None
+        self._indexed_analysis: Optional[AnalysisRecord] = None
+
+    @property
+    def image_input(self) -> Optional[Union[str, Image.Image]]:
+        """The preprocessed image in whichever form the session holds it"""
+        return self.image if self.image is not None else self.image_path
+
+    @property
+    def blip_input(self) -> Optional[Union[str, Image.Image]]:
+        """The image sized for BLIP, falling back to the preprocessed image"""
+        return self.model_inputs.get('blip') or self.image_input
+
+    @property
+    def yolo_results(self) -> Optional[Dict]:
+        """Detector results in dict form, derived from the analysis record"""
+        return self.analysis.yolo_results if self.analysis is not None else None
+
+    @property
+    def blip_caption(self) -> Optional[str]:
+        return self.analysis.caption if self.analysis is not None else self.video_caption
+
+    @property
+    def image_context(self) -> Optional[str]:
+        """LLM context of the image or video clip; None before any analysis"""
+        return self.analysis.image_context if self.analysis is not None else self.video_context
+
+    @property
+    def has_context(self) -> bool:
+        return self.analysis is not None or self.video_context is not None
+
+    @property
+    def detection_index(self) -> Optional[DetectionIndex]:
+        """Lookup structures over the current detections, built on first use"""
+        if self.analysis is None:
+            return None
+        if self._detection_index is None or self._indexed_analysis is not self.analysis:
+            self._detection_index = DetectionIndex(self.analysis.yolo_results)
+            self._indexed_analysis = self.analysis
+        return self._detection_index
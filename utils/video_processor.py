@@ -0,0 +1,179 @@
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+import cv2
+import numpy as np
+from PIL import Image
+from config import Config
+
+class SceneSegment:
+    """Aggregated analysis of one scene; frames themselves are not kept"""
+
+    def __init__(self, start: float, caption: str):
+        self.start = start
+        self.end = start
+        self.caption = caption
+        self.max_counts: Counter = Counter()
+        self.positions: Dict[str, Counter] = {}
+        self.frames = 0
+
+    def add_detections(self, timestamp: float, detections: List[Dict]):
+        """Fold one sampled frame's detections into the segment"""
+        self.end = timestamp
+        self.frames += 1
+
+        counts = Counter(det['class'] for det in detections)
+        for class_name, count in counts.items():
+            self.max_counts[class_name] = max(self.max_counts[class_name], count)
+        for det in detections:
+            self.positions.setdefault(det['class'], Counter())[det['position']] += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            'start': self.start,
+            'end': self.end,
+            'caption': self.caption,
+            'objects': dict(self.max_counts),
+            'positions': {
+                class_name: positions.most_common(1)[0][0]
+                for class_name, positions in self.positions.items()
+            },
+        }
+
+class VideoAnalyzer:
+    """
+    Builds a compact scene timeline for a video clip
+
+    Frames are decoded one at a time from a generator and sampled at
+    Config.VIDEO_SAMPLE_FPS. A sampled frame that differs strongly from the
+    previous keyframe starts a new scene and is captioned by BLIP; frames
+    that barely changed reuse the previous detections; everything else goes
+    through YOLO in small batches. Only the current batch, one thumbnail for
+    change detection and the per-scene aggregates are ever held in memory.
+    """
+
+    THUMBNAIL_SIZE = (64, 36)
+
+    def __init__(self, yolo, blip):
+        self.yolo = yolo
+        self.blip = blip
+
+    @staticmethod
+    def iter_frames(video_path: str, sample_fps: float) -> Iterator[Tuple[float, np.ndarray]]:
+        """
+        Yield (timestamp, BGR frame) at roughly sample_fps
+
+        Skipped frames are still decoded by grab(), since inter-coded frames
+        depend on them; only their conversion and copy out are saved.
+        """
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+
+        try:
+            fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+            step = max(1, round(fps / sample_fps))
+            index = 0
+            while True:
+                # grab() advances without the cost of converting the frame
+                if not capture.grab():
+                    break
+                if index % step == 0:
+                    ok, frame = capture.retrieve()
+                    if not ok:
+                        break
+                    yield index / fps, frame
+                index += 1
+        finally:
+            capture.release()
+
+    @classmethod
+    def _thumbnail(cls, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, cls.THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    @staticmethod
+    def _to_pil(frame: np.ndarray) -> Image.Image:
+        image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        image.thumbnail(Config.MAX_IMAGE_SIZE, Image.Resampling.LANCZOS)
+        return image
+
+    def analyze(self, video_path: str) -> Dict:
+        """
+        Analyze a clip
+
+        Returns:
+            Dict with the scene timeline, duration, counts of sampled,
+            detected and reused frames, and a representative keyframe
+            (PIL image of the longest scene) for follow-up VQA
+        """
+        segments: List[Dict] = []
+        current: Optional[SceneSegment] = None
+        current_keyframe: Optional[Image.Image] = None
+        best_keyframe: Optional[Image.Image] = None
+        best_length = -1.0
+
+        # Sampled frames waiting for YOLO; None marks "same as previous frame"
+        pending: List[Tuple[float, Optional[np.ndarray]]] = []
+        last_detections: List[Dict] = []
+        keyframe_thumb = None
+        previous_thumb = None
+        stats = Counter()
+        timestamp = 0.0
+
+        def flush():
+            nonlocal last_detections
+            frames = [frame for _, frame in pending if frame is not None]
+            results = iter(self.yolo.detect_batch(frames)) if frames else iter(())
+            for frame_time, frame in pending:
+                if frame is not None:
+                    last_detections = next(results)['detections']
+                current.add_detections(frame_time, last_detections)
+            pending.clear()
+
+        def close_segment():
+            nonlocal best_keyframe, best_length
+            flush()
+            segments.append(current.to_dict())
+            if current.end - current.start > best_length:
+                best_length = current.end - current.start
+                best_keyframe = current_keyframe
+
+        for timestamp, frame in self.iter_frames(video_path, Config.VIDEO_SAMPLE_FPS):
+            stats['sampled'] += 1
+            thumb = self._thumbnail(frame)
+
+            scene_change = (
+                keyframe_thumb is None
+                or np.abs(thumb - keyframe_thumb).mean() / 255 > Config.VIDEO_SCENE_THRESHOLD
+            )
+            if scene_change and len(segments) < Config.VIDEO_MAX_SCENES:
+                if current is not None:
+                    close_segment()
+                current_keyframe = self._to_pil(frame)
+                current = SceneSegment(timestamp, self.blip.generate_caption(current_keyframe))
+                keyframe_thumb = thumb
+                stats['keyframes'] += 1
+
+            if (previous_thumb is not None and not scene_change
+                    and np.abs(thumb - previous_thumb).mean() / 255 < Config.VIDEO_REUSE_THRESHOLD):
+                pending.append((timestamp, None))
+                stats['reused'] += 1
+            else:
+                pending.append((timestamp, frame))
+                stats['detected'] += 1
+            previous_thumb = thumb
+
+            if len(pending) >= Config.VIDEO_BATCH_SIZE:
+                flush()
+
+        if current is not None:
+            close_segment()
+
+        return {
+            'segments': segments,
+            'duration': timestamp,
+            'frames_sampled': stats['sampled'],
+            'frames_detected': stats['detected'],
+            'frames_reused': stats['reused'],
+            'keyframe': best_keyframe,
+        }
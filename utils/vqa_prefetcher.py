@@ -0,0 +1,131 @@
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import re
+import threading
+import time
+from config import Config
+from utils.session import ImageSession
+
+# Words a question can contain and still ask exactly what a probe asked
+_GENERIC_WORDS = {
+    "what", "whats", "s", "is", "are", "was", "the", "a", "an", "in", "of", "this", "that",
+    "it", "there", "do", "does", "you", "see", "can", "tell", "me", "about", "i", "and",
+    "or", "any", "some", "here", "how", "which", "kind", "type", "like", "look", "looks",
+    "image", "picture", "photo", "scene", "main", "dominant", "overall", "colors", "colours",
+    "person", "people", "they", "he", "she", "someone", "his", "her", "their", "taken",
+}
+
+class VQAPrefetcher:
+    """
+    Runs common BLIP VQA probes in the background after an image is analyzed
+
+    Probes only run while no user request is in flight, and the one in
+    progress is cancelled as soon as a request arrives, so prefetching never
+    competes with real work. Answers are stored on the session; chat() uses
+    them in place of VQA for generic questions matching a probe's keywords,
+    and as extra context for more specific questions on the same topic.
+    """
+
+    def __init__(self, blip, probes: Optional[Dict[str, Tuple[str, list]]] = None):
+        self.blip = blip
+        self.probes = probes or Config.VQA_PREFETCH_PROBES
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._cancel = threading.Event()
+        self._active_requests = 0
+        self._last_activity = time.monotonic()
+
+        threading.Thread(target=self._run, name="vqa-prefetcher", daemon=True).start()
+
+    def schedule(self, session: ImageSession):
+        """Queue probes for the session's current image"""
+        with self._cond:
+            self._pending.append((session, session.blip_input))
+            self._cond.notify()
+
+    @contextmanager
+    def foreground(self):
+        """Mark a user request as in flight, cancelling any running probe"""
+        with self._cond:
+            self._active_requests += 1
+            self._last_activity = time.monotonic()
+            self._cancel.set()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active_requests -= 1
+                self._last_activity = time.monotonic()
+                self._cond.notify()
+
+    def _matching_probe(self, session: ImageSession, words: List[str]) -> Optional[Tuple[str, list]]:
+        """(answer, keywords) of a finished probe whose keywords appear as whole words"""
+        text = f" {' '.join(words)} "
+        for name, (_, keywords) in self.probes.items():
+            answer = session.vqa_answers.get(name)
+            if answer and any(f" {keyword} " in text for keyword in keywords):
+                return answer, keywords
+        return None
+
+    def match(self, session: ImageSession, question: str) -> Optional[str]:
+        """
+        Prefetched answer that can stand in for a VQA pass on the question
+
+        Only generic questions qualify ("What colors are in the image?");
+        anything naming an object ("What color is the car?") is about
+        something the probe didn't ask, so it gets None.
+        """
+        words = re.findall(r"[a-z]+", question.lower())
+        probe = self._matching_probe(session, words)
+        if probe is None:
+            return None
+        answer, keywords = probe
+        keyword_words = {word for keyword in keywords for word in keyword.split()}
+        if all(word in _GENERIC_WORDS or word in keyword_words for word in words):
+            return answer
+        return None
+
+    def related(self, session: ImageSession, question: str) -> Optional[str]:
+        """Prefetched answer on the question's topic, usable as extra context only"""
+        probe = self._matching_probe(session, re.findall(r"[a-z]+", question.lower()))
+        return probe[0] if probe else None
+
+    def _next_probe(self):
+        """Wait until idle with work pending; return (session, image, name, question)"""
+        with self._cond:
+            while True:
+                idle_for = time.monotonic() - self._last_activity
+                if self._pending and self._active_requests == 0 and idle_for >= Config.VQA_PREFETCH_IDLE_S:
+                    session, image = self._pending[0]
+
+                    # Drop work for images that have since been replaced
+                    if session.blip_input is not image:
+                        self._pending.popleft()
+                        continue
+
+                    for name, (question, _) in self.probes.items():
+                        if name not in session.vqa_answers:
+                            self._cancel.clear()
+                            return session, image, name, question
+
+                    self._pending.popleft()
+                    continue
+
+                timeout = None if not self._pending else max(0.05, Config.VQA_PREFETCH_IDLE_S - idle_for)
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            session, image, name, question = self._next_probe()
+            try:
+                answer = self.blip.answer_question(image, question, cancel_event=self._cancel)
+            except Exception as e:
+                print(f"VQA prefetch failed: {e}")
+                answer = ""
+
+            # Cancelled probes are discarded and retried on the next idle period
+            with self._cond:
+                if not self._cancel.is_set() and session.blip_input is image:
+                    session.vqa_answers[name] = answer
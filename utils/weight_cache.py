@@ -0,0 +1,109 @@
+from pathlib import Path
+from typing import Tuple
+import json
+import os
+import shutil
+import torch
+from safetensors.torch import load_file, save_file
+from config import Config
+
+def _cache_root() -> Path:
+    return Path(Config.WEIGHT_CACHE_DIR)
+
+def _publish(tmp_path: Path, final_path: Path):
+    """Move a fully written cache entry into place; another worker may have won the race"""
+    try:
+        os.replace(tmp_path, final_path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def load_blip(model_name: str, dtype: torch.dtype) -> Tuple[object, object]:
+    """
+    Load the BLIP-2 processor and model from the local weight cache
+
+    The first load converts the hub checkpoint to the target dtype and saves
+    it as a single safetensors file. Later loads memory-map that file, so no
+    dtype conversion or pickle decoding happens and tensors are backed by the
+    page cache instead of private copies.
+    """
+    from transformers import Blip2Processor, Blip2ForConditionalGeneration
+
+    dtype_name = str(dtype).replace("torch.", "")
+    cache_dir = _cache_root() / "blip" / f"{model_name.replace('/', '--')}-{dtype_name}"
+
+    if not (cache_dir / "model.safetensors").exists():
+        print(f"Building weight cache for {model_name} ({dtype_name})...")
+        model = Blip2ForConditionalGeneration.from_pretrained(
+            model_name, torch_dtype=dtype, low_cpu_mem_usage=True
+        )
+        processor = Blip2Processor.from_pretrained(model_name)
+
+        tmp_dir = cache_dir.with_name(f"{cache_dir.name}.{os.getpid()}.tmp")
+        # One shard, so loading is a single mmap
+        model.save_pretrained(tmp_dir, safe_serialization=True, max_shard_size="100GB")
+        processor.save_pretrained(tmp_dir)
+        del model
+        cache_dir.parent.mkdir(parents=True, exist_ok=True)
+        _publish(tmp_dir, cache_dir)
+
+    processor = Blip2Processor.from_pretrained(cache_dir)
+    model = Blip2ForConditionalGeneration.from_pretrained(
+        cache_dir,
+        torch_dtype=dtype,
+        low_cpu_mem_usage=True,
+        use_safetensors=True
+    )
+    return processor, model
+
+def load_yolo(weights: str):
+    """
+    Load a YOLO checkpoint from the local weight cache
+
+    The pickled checkpoint is unpacked once into a float32 safetensors
+    state dict plus the model's architecture and class names. Later loads
+    build the architecture and assign the memory-mapped tensors directly.
+    Falls back to loading the checkpoint normally if the cache can't be used.
+    """
+    from ultralytics import YOLO
+
+    cache_dir = _cache_root() / "yolo" / Path(weights).stem
+    tensors_path = cache_dir / "model.safetensors"
+    meta_path = cache_dir / "meta.json"
+
+    if not tensors_path.exists():
+        model = YOLO(weights)
+        try:
+            print(f"Building weight cache for {weights}...")
+            tmp_dir = cache_dir.with_name(f"{cache_dir.name}.{os.getpid()}.tmp")
+            tmp_dir.mkdir(parents=True, exist_ok=True)
+
+            state = {k: v.float().contiguous() if v.is_floating_point() else v.contiguous()
+                     for k, v in model.model.state_dict().items()}
+            save_file(state, str(tmp_dir / "model.safetensors"))
+            with open(tmp_dir / "meta.json", "w") as f:
+                json.dump({"yaml": model.model.yaml, "names": model.model.names}, f)
+            _publish(tmp_dir, cache_dir)
+        except Exception as e:
+            print(f"Could not cache YOLO weights: {e}")
+        return model
+
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        # Building from the architecture dict skips unpickling the checkpoint.
+        # JSON is valid YAML, and the file keeps the checkpoint's name so
+        # ultralytics infers the same model scale (n/s/m/x) from it.
+        yaml_path = cache_dir / f"{Path(weights).stem}.yaml"
+        if not yaml_path.exists():
+            with open(yaml_path, "w") as f:
+                json.dump(meta["yaml"], f)
+        model = YOLO(str(yaml_path), task="detect")
+
+        model.model.load_state_dict(load_file(str(tensors_path)), assign=True)
+        model.model.names = {int(k): v for k, v in meta["names"].items()}
+        model.model.eval()
+        return model
+    except Exception as e:
+        print(f"Weight cache for {weights} unusable ({e}), loading checkpoint")
+        return YOLO(weights)
@@ -0,0 +1,511 @@
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterator, List, Optional
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+from config import Config
+from utils.scheduler import QueueFull
+
+class WorkerCrashed(RuntimeError):
+    """Raised for requests in flight on a worker process that died"""
+
+# Chatbot methods the front process may call on a worker directly
+REMOTE_CALLS = {
+    "session_info", "get_history_since", "get_conversation_history",
+    "get_detection_preview", "get_opening_response", "release_session",
+}
+
+def _config_snapshot() -> Dict:
+    """Config values as set in this process, including command-line overrides"""
+    return {
+        name: value for name, value in vars(Config).items()
+        if name.isupper() and not callable(value)
+    }
+
+def _default_chatbot():
+    from main import ConversationalImageChatbot
+    return ConversationalImageChatbot()
+
+def _picklable_error(error: BaseException) -> BaseException:
+    """The error itself if it survives pickling, else a RuntimeError carrying its message"""
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+def _read_image(image_ref):
+    """Image bytes from a ('shm', name, size) reference; file paths pass through"""
+    if not isinstance(image_ref, tuple):
+        return image_ref
+    _, name, size = image_ref
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+
+def _worker_main(index: int, config_values: Dict, chatbot_factory: Callable,
+                 requests, responses):
+    """
+    Entry point of a model worker process
+
+    Hosts one chatbot behind its own PipelineScheduler and serves requests
+    from the front process until it receives None.
+    """
+    for name, value in config_values.items():
+        setattr(Config, name, value)
+
+    from utils.scheduler import PipelineScheduler
+
+    chatbot = chatbot_factory()
+    scheduler = PipelineScheduler(chatbot)
+    calls = ThreadPoolExecutor(max_workers=Config.WORKER_CALL_THREADS,
+                               thread_name_prefix=f"worker-{index}-call")
+
+    def reply(request_id, future: Future):
+        error = future.exception()
+        if error is not None:
+            responses.put(("error", request_id, _picklable_error(error)))
+        else:
+            responses.put(("result", request_id, future.result()))
+
+    def stream(request_id, message, session_id, profile, backend):
+        for chunk in chatbot.chat_stream(message, session_id, profile=profile, backend=backend):
+            responses.put(("chunk", request_id, chunk))
+
+    responses.put(("ready", None, os.getpid()))
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, kind, args = request
+        try:
+            if kind == "analyze":
+                image_ref, session_id, user_id, profile = args
+                future = scheduler.submit_analysis(
+                    _read_image(image_ref), session_id, user_id=user_id, profile=profile
+                )
+            elif kind == "chat":
+                message, session_id, user_id, profile, backend = args
+                future = scheduler.submit_chat(
+                    message, session_id, user_id=user_id, profile=profile, backend=backend
+                )
+            elif kind == "stream":
+                message, session_id, user_id, profile, backend = args
+                future = scheduler.submit_chat(
+                    message, session_id, user_id=user_id,
+                    fn=lambda rid=request_id: stream(rid, message, session_id, profile, backend)
+                )
+            elif kind == "stats":
+                future = calls.submit(scheduler.stats)
+            else:
+                method, call_args, call_kwargs = args
+                if method not in REMOTE_CALLS:
+                    raise ValueError(f"Unknown worker call '{method}'")
+                future = calls.submit(getattr(chatbot, method), *call_args, **call_kwargs)
+        except Exception as e:
+            responses.put(("error", request_id, _picklable_error(e)))
+            continue
+        future.add_done_callback(lambda f, rid=request_id: reply(rid, f))
+
+    calls.shutdown(wait=False)
+
+class _Worker:
+    """Front-process view of one worker process"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.requests = None
+        self.responses = None
+        self.pid = None
+        self.ready = threading.Event()
+        self.in_flight = 0
+        self.restarts = 0
+        self.completed = 0
+
+    @property
+    def available(self) -> bool:
+        return self.ready.is_set() and self.process is not None and self.process.is_alive()
+
+class _Pending:
+    """A request awaiting its worker's reply"""
+
+    def __init__(self, worker: _Worker, session_id: Optional[str], shm=None, chunks=None):
+        self.future = Future()
+        self.worker = worker
+        self.session_id = session_id
+        self.shm = shm
+        self.chunks = chunks  # queue.Queue of streamed text, for stream requests
+
+class WorkerPool:
+    """
+    Model worker processes behind one front process
+
+    Each worker process runs its own ConversationalImageChatbot and
+    PipelineScheduler, so workers don't share a GIL or torch thread pool.
+    Torch threads are divided between them. The front (the Gradio app or
+    API) talks to them over multiprocessing queues. Uploaded images are
+    handed over in shared memory rather than pickled.
+
+    Requests for a session go to the worker that holds its image context,
+    detections and BLIP state. A saturated worker's sessions spill to the
+    least loaded worker. That worker rehydrates them from the shared result
+    store, which is why moving a conversation requires
+    Config.RESULT_STORE_ENABLED. New analyses can always move. Dead workers
+    are restarted; their in-flight requests fail with WorkerCrashed and
+    their sessions are rehydrated elsewhere on next use.
+
+    The pool has the PipelineScheduler interface (submit_analysis,
+    submit_chat, stats), and its chatbot attribute answers the chatbot
+    methods the UI and API call, so either can be used in place of the
+    in-process pair.
+    """
+
+    def __init__(self, num_workers: Optional[int] = None,
+                 chatbot_factory: Optional[Callable] = None):
+        self.num_workers = num_workers or Config.WORKER_PROCESSES or 1
+        self.chatbot_factory = chatbot_factory or _default_chatbot
+        self.chatbot = RemoteChatbot(self)
+
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[_Worker] = [_Worker(i) for i in range(self.num_workers)]
+        self._pending: Dict[int, _Pending] = {}
+        self._affinity: Dict[str, int] = {}
+        self._session_in_flight: Counter = Counter()
+        self._moving: Dict[str, Future] = {}  # Sessions being handed to another worker
+        self._request_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.moved_sessions = 0
+
+        # Runs front-side work for submit_chat(fn=...), such as driving a stream
+        self._local = ThreadPoolExecutor(
+            max_workers=self.num_workers * Config.WORKER_MAX_INFLIGHT,
+            thread_name_prefix="pool-front"
+        )
+
+        for worker in self._workers:
+            self._start(worker)
+            threading.Thread(
+                target=self._read_responses, args=(worker,),
+                name=f"pool-reader-{worker.index}", daemon=True
+            ).start()
+
+        print(f"Starting {self.num_workers} model worker processes...")
+        deadline = time.monotonic() + Config.WORKER_START_TIMEOUT_S
+        for worker in self._workers:
+            if not worker.ready.wait(max(0.0, deadline - time.monotonic())):
+                raise RuntimeError(f"Model worker {worker.index} did not start in time")
+        print(f"✓ {self.num_workers} model workers ready")
+
+    def _start(self, worker: _Worker):
+        """Launch (or relaunch) a worker process with fresh queues"""
+        config_values = _config_snapshot()
+        if Config.TORCH_INTRA_OP_THREADS:
+            config_values['TORCH_INTRA_OP_THREADS'] = max(
+                1, Config.TORCH_INTRA_OP_THREADS // self.num_workers
+            )
+        config_values['ONNX_INTRA_OP_THREADS'] = max(
+            1, Config.ONNX_INTRA_OP_THREADS // self.num_workers
+        )
+
+        worker.ready.clear()
+        worker.requests = self._context.Queue()
+        worker.responses = self._context.Queue()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.index, config_values, self.chatbot_factory,
+                  worker.requests, worker.responses),
+            name=f"model-worker-{worker.index}",
+            daemon=True
+        )
+        worker.process.start()
+
+    def _read_responses(self, worker: _Worker):
+        """Resolve futures from one worker's replies; restart it if it dies"""
+        while not self._closed:
+            try:
+                kind, request_id, value = worker.responses.get(timeout=1.0)
+            except queue.Empty:
+                if worker.process is not None and not worker.process.is_alive() and not self._closed:
+                    self._restart(worker)
+                continue
+            except (EOFError, OSError):
+                continue
+
+            if kind == "ready":
+                worker.pid = value
+                worker.ready.set()
+                continue
+            with self._lock:
+                pending = self._pending.get(request_id)
+            if pending is None:
+                continue
+            if kind == "chunk":
+                pending.chunks.put(value)
+                continue
+
+            self._finish(request_id)
+            if kind == "error":
+                pending.future.set_exception(value)
+            else:
+                pending.future.set_result(value)
+
+    def _finish(self, request_id: int) -> Optional[_Pending]:
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+            if pending is None:
+                return None
+            pending.worker.in_flight -= 1
+            pending.worker.completed += 1
+            if pending.session_id is not None:
+                self._session_in_flight[pending.session_id] -= 1
+                if self._session_in_flight[pending.session_id] <= 0:
+                    del self._session_in_flight[pending.session_id]
+        if pending.shm is not None:
+            pending.shm.close()
+            pending.shm.unlink()
+        if pending.chunks is not None:
+            pending.chunks.put(None)
+        return pending
+
+    def _restart(self, worker: _Worker):
+        """Fail the dead worker's requests, forget its sessions and start a new process"""
+        print(f"Model worker {worker.index} (pid {worker.pid}) exited "
+              f"with code {worker.process.exitcode}; restarting")
+        worker.ready.clear()
+        with self._lock:
+            lost = [rid for rid, p in self._pending.items() if p.worker is worker]
+            for session_id in [s for s, i in self._affinity.items() if i == worker.index]:
+                del self._affinity[session_id]
+        for request_id in lost:
+            pending = self._finish(request_id)
+            if pending is not None:
+                pending.future.set_exception(
+                    WorkerCrashed(f"Model worker {worker.index} exited during the request")
+                )
+        worker.restarts += 1
+        self._start(worker)
+
+    def _route(self, session_id: Optional[str], can_move: bool) -> _Worker:
+        """
+        Worker for a session's next request
+
+        Sticks to the session's worker unless it is down or saturated and
+        the session may move; raises QueueFull when every worker is saturated.
+        While a session is moving, other requests for it wait for the move.
+        """
+        session_id = session_id or "default"
+        while True:
+            with self._lock:
+                moving = self._moving.get(session_id)
+                if moving is None:
+                    worker, release_from = self._choose(session_id, can_move)
+                    if release_from is None:
+                        return worker
+                    moving = self._moving[session_id] = Future()
+                    break
+            # Another request is moving this session; route again once it lands
+            moving.result()
+
+        # Save the session to the store before the new worker reads it
+        target = worker
+        try:
+            self._send(
+                release_from, None, "call", ("release_session", (session_id,), {})
+            ).result(timeout=Config.WORKER_RELEASE_TIMEOUT_S)
+            self.moved_sessions += 1
+        except Exception as e:
+            # Stay put; the old worker still has (or has saved) the session
+            print(f"Could not move session '{session_id}' off worker {release_from.index}: {e}")
+            target = release_from
+        with self._lock:
+            self._affinity[session_id] = target.index
+            del self._moving[session_id]
+        moving.set_result(target)
+        return target
+
+    def _choose(self, session_id: str, can_move: bool):
+        """
+        (worker, worker to release the session from) for a session; caller holds _lock
+
+        The second item is set only when the session must be saved by its
+        current worker before the chosen worker can take it over.
+        """
+        current = self._affinity.get(session_id)
+        worker = self._workers[current] if current is not None else None
+        if worker is not None and worker.available and (
+            worker.in_flight < Config.WORKER_MAX_INFLIGHT
+            or not can_move or self._session_in_flight[session_id] > 0
+        ):
+            return worker, None
+
+        candidates = [
+            w for w in self._workers
+            if w.available and w.in_flight < Config.WORKER_MAX_INFLIGHT
+        ]
+        if not candidates:
+            raise QueueFull("All model workers are saturated")
+        target = min(candidates, key=lambda w: w.in_flight)
+        if worker is not None and worker.available:
+            return target, worker
+
+        # New session, or its worker died: nothing to hand over
+        self._affinity[session_id] = target.index
+        return target, None
+
+    def _send(self, worker: _Worker, session_id: Optional[str], kind: str, args,
+              shm=None, chunks=None) -> Future:
+        pending = _Pending(worker, session_id, shm, chunks)
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._pending[request_id] = pending
+            worker.in_flight += 1
+            if session_id is not None:
+                self._session_in_flight[session_id] += 1
+        worker.requests.put((request_id, kind, args))
+        return pending.future
+
+    def _can_move_conversation(self) -> bool:
+        return Config.RESULT_STORE_ENABLED
+
+    def submit_analysis(self, image, session_id: Optional[str] = None,
+                        user_id: Optional[str] = None, profile: Optional[bool] = None) -> Future:
+        """Analyze an image (bytes or a path) on the session's worker"""
+        session_id = session_id or "default"
+        worker = self._route(session_id, can_move=True)
+
+        shm = None
+        image_ref = image
+        if isinstance(image, bytes):
+            shm = shared_memory.SharedMemory(create=True, size=max(1, len(image)))
+            shm.buf[:len(image)] = image
+            image_ref = ("shm", shm.name, len(image))
+        return self._send(
+            worker, session_id, "analyze", (image_ref, session_id, user_id, profile), shm=shm
+        )
+
+    def submit_chat(self, message: str, session_id: Optional[str] = None,
+                    user_id: Optional[str] = None, fn: Optional[Callable] = None,
+                    profile: Optional[bool] = None, backend: Optional[str] = None) -> Future:
+        """
+        Queue a chat turn on the session's worker
+
+        A custom fn (e.g. one driving chatbot.chat_stream) runs on a front
+        thread once admission succeeds; the calls it makes are routed as usual.
+        """
+        session_id = session_id or "default"
+        if fn is not None:
+            self._route(session_id, can_move=self._can_move_conversation())
+            return self._local.submit(fn)
+        worker = self._route(session_id, can_move=self._can_move_conversation())
+        return self._send(
+            worker, session_id, "chat", (message, session_id, user_id, profile, backend)
+        )
+
+    def stream_chat(self, message: str, session_id: Optional[str] = None,
+                    user_id: Optional[str] = None, profile: Optional[bool] = None,
+                    backend: Optional[str] = None) -> Iterator[str]:
+        """Stream a chat turn's answer from the session's worker"""
+        session_id = session_id or "default"
+        worker = self._route(session_id, can_move=self._can_move_conversation())
+        chunks = queue.Queue()
+        future = self._send(
+            worker, session_id, "stream", (message, session_id, user_id, profile, backend),
+            chunks=chunks
+        )
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        future.result()
+
+    def call(self, session_id: Optional[str], method: str, *args, **kwargs):
+        """
+        Call a chatbot method on the session's worker and wait for the result
+
+        Calls are reads (history, previews, status), so they never move a session.
+        """
+        session_id = session_id or "default"
+        worker = self._route(session_id, can_move=False)
+        return self._send(worker, session_id, "call", (method, args, kwargs)).result()
+
+    def stats(self) -> Dict:
+        """Per-worker load and restarts, plus each worker's own queue statistics"""
+        workers = {}
+        for worker in self._workers:
+            entry = {
+                'pid': worker.pid,
+                'alive': worker.available,
+                'in_flight': worker.in_flight,
+                'completed': worker.completed,
+                'restarts': worker.restarts,
+            }
+            if worker.available:
+                try:
+                    entry['queues'] = self._send(worker, None, "stats", ()).result(timeout=5)
+                except Exception as e:
+                    entry['queues'] = {'error': str(e)}
+            workers[f"worker-{worker.index}"] = entry
+        return {
+            'workers': workers,
+            'sessions': len(self._affinity),
+            'moved_sessions': self.moved_sessions,
+        }
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        self._closed = True
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.requests.put(None)
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(timeout=10)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+        self._local.shutdown(wait=False)
+
+class RemoteChatbot:
+    """
+    The chatbot methods used by the UI and API, answered by the session's worker
+
+    Analysis and chat turns go through the pool's submit methods; these are
+    the remaining per-session reads, plus streaming.
+    """
+
+    def __init__(self, pool: WorkerPool):
+        self.pool = pool
+
+    def chat_stream(self, user_message: str, session_id: Optional[str] = None,
+                    profile: Optional[bool] = None, backend: Optional[str] = None) -> Iterator[str]:
+        return self.pool.stream_chat(user_message, session_id, profile=profile, backend=backend)
+
+    def session_info(self, session_id: Optional[str] = None) -> dict:
+        return self.pool.call(session_id, "session_info", session_id)
+
+    def get_history_since(self, session_id: Optional[str] = None, cursor: int = 0):
+        return self.pool.call(session_id, "get_history_since", session_id, cursor)
+
+    def get_conversation_history(self, session_id: Optional[str] = None) -> list:
+        return self.pool.call(session_id, "get_conversation_history", session_id)
+
+    def get_detection_preview(self, session_id: Optional[str] = None,
+                              full_resolution: bool = False) -> Optional[str]:
+        # The preview cache directory is shared, so the path is valid here too
+        return self.pool.call(
+            session_id, "get_detection_preview", session_id, full_resolution=full_resolution
+        )
+
+    def get_opening_response(self, session_id: Optional[str] = None,
+                             timeout: Optional[float] = None) -> Optional[str]:
+        return self.pool.call(session_id, "get_opening_response", session_id, timeout)